@@ -0,0 +1,233 @@
+# core/api.py
+"""
+Read-only JSON API for scripts and dashboards.
+
+Responses carry a strong ETag derived from the ``updated_at`` fields (plus
+row counts, so deletions show up) and answer ``If-None-Match`` with 304 Not
+Modified before the data itself is queried. Bodies are read from the
+database like their ETags, not from the per-worker hierarchy cache, so an
+ETag always matches the data it was sent with. Membership listings are
+paginated with an opaque ``cursor`` (keyset on the membership ids) and
+``limit``.
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import urlencode
+from django.views.decorators.http import require_safe
+
+from . import hierarchy
+from .models import Project, WorkingGroup, Topic, WorkingGroupMembership, TopicMembership
+from .participation import WORKING_GROUP, TOPIC
+
+User = get_user_model()
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Listing order of the membership tables: (kind, model, entity FK field)
+MEMBERSHIP_KINDS = [
+    (WORKING_GROUP, WorkingGroupMembership, 'working_group'),
+    (TOPIC, TopicMembership, 'topic'),
+]
+
+JSON_PARAMS = {'separators': (',', ':')}
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 instead of redirecting to the login page"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Authentication required', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _fingerprint(queryset):
+    """(row count, latest updated_at) of a queryset"""
+    row = queryset.aggregate(n=Count('pk'), latest=Max('updated_at'))
+    return row['n'], row['latest']
+
+
+def _respond(request, etag, build):
+    """Return 304 when the client has ``etag``, otherwise the JSON built by ``build()``"""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = build()
+        if data is None:
+            # Deleted since the ETag was computed
+            return _error('Not found', 404)
+        response = JsonResponse(data, json_dumps_params=JSON_PARAMS)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _page_size(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None
+    return limit if 1 <= limit <= MAX_PAGE_SIZE else None
+
+
+def _parse_cursor(cursor):
+    """'<kind>.<id>' -> (kind index, id); None for the first page"""
+    if not cursor:
+        return 0, 0
+    kind, _, last_id = cursor.partition('.')
+    kinds = [k for k, _, _ in MEMBERSHIP_KINDS]
+    # isdigit() alone takes '²' and other non-ASCII digits that int() rejects
+    if kind not in kinds or not (last_id.isascii() and last_id.isdigit()):
+        return None
+    return kinds.index(kind), int(last_id)
+
+
+def _page_fingerprint(filters, cursor, limit):
+    """
+    [(kind, row count, last id, latest updated_at)] of the memberships a page
+    covers in each table: up to ``limit`` + 1 rows after ``cursor``, the
+    extra row telling whether there is a next page
+    """
+    kind_index, after = cursor
+    remaining = limit + 1
+    parts = []
+    for index in range(kind_index, len(MEMBERSHIP_KINDS)):
+        kind, model, _ = MEMBERSHIP_KINDS[index]
+        window = model.objects.filter(
+            **filters[kind], id__gt=after if index == kind_index else 0
+        ).order_by('id').values('pk')[:remaining]
+        row = model.objects.filter(pk__in=window).aggregate(n=Count('pk'), last=Max('pk'), latest=Max('updated_at'))
+        parts.append((kind, row['n'], row['last'], row['latest']))
+        remaining -= row['n']
+        if remaining <= 0:
+            break
+    return parts
+
+
+def _membership_page(filters, cursor, limit, with_username):
+    """
+    Fetch up to ``limit`` memberships matching ``filters`` ({kind: filter kwargs})
+    after ``cursor``, walking the working group table before the topic table.
+    Returns (rows, next_cursor).
+    """
+    kind_index, after = cursor
+    rows = []
+    for index in range(kind_index, len(MEMBERSHIP_KINDS)):
+        kind, model, field = MEMBERSHIP_KINDS[index]
+        fields = ['id', 'user_id', f'{field}_id', 'participation_level', 'updated_at']
+        if with_username:
+            fields.append('user__username')
+        queryset = model.objects.filter(**filters[kind], id__gt=after if index == kind_index else 0)
+        for values in queryset.order_by('id').values_list(*fields)[:limit + 1 - len(rows)]:
+            rows.append((kind, *values))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, f'{rows[-1][0]}.{rows[-1][1]}'
+    return rows, None
+
+
+def _membership_json(row, with_username):
+    kind, membership_id, user_id, entity_id, level, updated_at = row[:6]
+    data = {
+        'id': membership_id,
+        'type': kind,
+        'entity_id': entity_id,
+        'user_id': user_id,
+        'level': level,
+        'updated_at': updated_at.isoformat(),
+    }
+    if with_username:
+        data['username'] = row[6]
+    return data
+
+
+def _membership_listing(request, filters, with_username):
+    limit = _page_size(request)
+    if limit is None:
+        return _error(f'limit must be between 1 and {MAX_PAGE_SIZE}', 400)
+    cursor = _parse_cursor(request.GET.get('cursor'))
+    if cursor is None:
+        return _error('Invalid cursor', 400)
+
+    # Renaming a user does not change the ETag of the pages listing them
+    etag = _etag(request.path, cursor, limit, _page_fingerprint(filters, cursor, limit))
+
+    def build():
+        rows, next_cursor = _membership_page(filters, cursor, limit, with_username)
+        return {
+            'results': [_membership_json(row, with_username) for row in rows],
+            'next': (
+                f'{request.path}?{urlencode({"cursor": next_cursor, "limit": limit})}'
+                if next_cursor else None
+            ),
+        }
+    return _respond(request, etag, build)
+
+
+@require_safe
+@api_login_required
+def project_list(request):
+    """All projects with their working group counts"""
+    etag = _etag(_fingerprint(Project.objects.all()), _fingerprint(WorkingGroup.objects.all()))
+
+    def build():
+        return {'results': [
+            {**project, 'url': reverse('core:api_project_tree', args=[project['id']])}
+            for project in hierarchy.load_project_index()
+        ]}
+    return _respond(request, etag, build)
+
+
+@require_safe
+@api_login_required
+def project_tree(request, pk):
+    """A project with its working groups and their topics"""
+    updated_at = Project.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return _error('Project not found', 404)
+    etag = _etag(
+        pk, updated_at,
+        _fingerprint(WorkingGroup.objects.filter(project_id=pk)),
+        _fingerprint(Topic.objects.filter(working_group__project_id=pk)),
+    )
+    return _respond(request, etag, lambda: hierarchy.load_project_tree(pk))
+
+
+@require_safe
+@api_login_required
+def project_memberships(request, pk):
+    """All working group and topic memberships of a project, paginated"""
+    if not Project.objects.filter(pk=pk).exists():
+        return _error('Project not found', 404)
+    return _membership_listing(request, {
+        WORKING_GROUP: {'working_group__project_id': pk},
+        TOPIC: {'topic__working_group__project_id': pk},
+    }, with_username=True)
+
+
+@require_safe
+@api_login_required
+def user_participation(request, username):
+    """All working group and topic memberships of a user, paginated"""
+    user_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+    if user_id is None:
+        return _error('User not found', 404)
+    return _membership_listing(request, {
+        WORKING_GROUP: {'user_id': user_id},
+        TOPIC: {'user_id': user_id},
+    }, with_username=False)
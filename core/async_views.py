@@ -0,0 +1,152 @@
+# core/async_views.py
+"""
+Async versions of the read-heavy pages, routed by core/urls.py when
+ASYNC_VIEWS is enabled (the default under faberorg.asgi). Queries go through
+Django's async ORM; the hierarchy cache helpers are sync and run in a thread.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import get_template, render_to_string
+
+from . import dashboard, export, fragments, hierarchy, matrix
+from .models import Project, Topic
+from .participation import aget_participation_index
+from .views import ROWS_MARKER, _export_response, _project_tree_or_404
+
+get_project_tree_or_404 = sync_to_async(_project_tree_or_404)
+
+
+async def _load_user(request):
+    """
+    Resolve request.user without blocking: templates read it through the auth
+    context processor, which would otherwise query the database synchronously.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+@login_required
+async def project_list(request):
+    """List all active projects"""
+    await _load_user(request)
+    projects = [p for p in await sync_to_async(hierarchy.get_project_index)() if p['is_active']]
+    return render(request, 'core/project_list.html', {'projects': projects})
+
+
+@login_required
+async def project_detail(request, pk):
+    """Show project details with working groups"""
+    await _load_user(request)
+    project = await get_project_tree_or_404(pk)
+    return render(request, 'core/project_detail.html', {
+        'project': project,
+        'working_groups': project['working_groups']
+    })
+
+
+@login_required
+async def topic_detail(request, pk):
+    """Show topic details"""
+    await _load_user(request)
+    topic = await aget_object_or_404(Topic.objects.select_related('working_group__project'), pk=pk)
+    return render(request, 'core/topic_detail.html', {'topic': topic})
+
+
+@login_required
+async def hierarchy_table(request):
+    """Display all projects, working groups, and topics in a table"""
+    await _load_user(request)
+    project_index = await sync_to_async(hierarchy.get_project_index)()
+    project_ids = [p['id'] for p in project_index]
+    trees = await sync_to_async(hierarchy.get_project_trees)(project_ids)
+    projects = [trees[project_id] for project_id in project_ids if project_id in trees]
+
+    # Load the user's memberships once for the participation tags
+    await aget_participation_index(request)
+
+    return render(request, 'core/hierarchy_table.html', {
+        'projects': projects
+    })
+
+
+@login_required
+async def my_participation(request):
+    """List the current user's working group and topic memberships across all projects"""
+    user = await _load_user(request)
+    return render(request, 'core/my_participation.html', {
+        'projects': await sync_to_async(dashboard.get_dashboard)(user.pk),
+    })
+
+
+@login_required
+async def project_participation_table(request):
+    """Display participation table for a specific project"""
+    project_id = request.GET.get('project')
+    if not project_id:
+        return redirect('core:project_list')
+
+    user = await _load_user(request)
+    project = await get_project_tree_or_404(project_id)
+
+    table = await sync_to_async(fragments.participation_table)(project)
+    participation = await aget_participation_index(request)
+
+    return render(request, 'core/project_participation_table.html', {
+        'project': project,
+        'table': fragments.overlay_participation(table, participation),
+        'user_keycloak_id': user.username,
+        'slot_templates': fragments.slot_templates(),
+    })
+
+
+@login_required
+async def users_participation_matrix(request):
+    """Async version of views.users_participation_matrix, streaming the rows"""
+    project_id = request.GET.get('project')
+    if not project_id:
+        return redirect('core:project_list')
+    await _load_user(request)
+    project = await aget_object_or_404(Project, pk=project_id, is_active=True)
+
+    after = request.GET.get('after') or None
+    search = request.GET.get('q') or None
+
+    columns = await matrix.abuild_columns(project)
+    users, next_after = await matrix.amember_users(project, after=after, search=search)
+
+    page = render_to_string('core/users_participation_matrix.html', {
+        'project': project,
+        'columns': columns,
+        'has_rows': bool(users),
+        'rows_marker': ROWS_MARKER,
+        'after': after,
+        'search': search or '',
+        'next_after': next_after,
+    }, request=request)
+    head, tail = page.split(ROWS_MARKER, 1)
+
+    async def stream():
+        yield head
+        if users:
+            cells = await matrix.amembership_cells(project, [u.id for u in users])
+            row_template = get_template('core/users_participation_matrix_rows.html')
+            rows = matrix.iter_rows(users, columns, cells)
+            for chunk in matrix.iter_chunks(rows):
+                yield row_template.render({'rows': chunk})
+        yield tail
+
+    return StreamingHttpResponse(stream(), content_type='text/html; charset=utf-8')
+
+
+@login_required
+async def users_participation_export(request):
+    """Async version of views.users_participation_export"""
+    project_id = request.GET.get('project')
+    if not project_id:
+        return redirect('core:project_list')
+    await _load_user(request)
+    project = await aget_object_or_404(Project, pk=project_id, is_active=True)
+    # A sync iterator would be read whole before sending; pull it part by part
+    return _export_response(request, project, stream=export.astream)
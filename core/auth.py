@@ -1,10 +1,74 @@
 # core/auth.py
+from functools import lru_cache
+
 from django.contrib.auth.models import Group
+from django.core.exceptions import SuspiciousOperation
+from django.db import IntegrityError, transaction
+from django.utils.encoding import smart_str
+from josepy.jws import JWS, Header
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
+from requests.auth import HTTPBasicAuth
+
+from . import jwks
+from .metrics import time_oidc
+
+
+@lru_cache(maxsize=None)
+def _users_group_id():
+    """Id of the "users" group, looked up (or created) once per process"""
+    grp, _ = Group.objects.get_or_create(name="users")
+    return grp.id
 
 
 class KeycloakOIDCBackend(OIDCAuthenticationBackend):
 
+    def authenticate(self, request, **kwargs):
+        """Time the whole OIDC code flow"""
+        with time_oidc('authenticate'):
+            return super().authenticate(request, **kwargs)
+
+    def get_token(self, payload):
+        """Return token object as a dictionary, over the pooled session"""
+        with time_oidc('token'):
+            auth = None
+            if self.get_settings("OIDC_TOKEN_USE_BASIC_AUTH", False):
+                # When Basic auth is defined, create the Auth Header and remove secret from payload.
+                auth = HTTPBasicAuth(payload.get("client_id"), payload.get("client_secret"))
+                del payload["client_secret"]
+
+            response = jwks.get_session().post(
+                self.OIDC_OP_TOKEN_ENDPOINT, data=payload, auth=auth, **jwks.request_kwargs()
+            )
+            self.raise_token_response_error(response)
+            return response.json()
+
+    def verify_token(self, token, **kwargs):
+        with time_oidc('verify_token'):
+            return super().verify_token(token, **kwargs)
+
+    def retrieve_matching_jwk(self, token):
+        """Get the signing key from the cached JWKS instead of fetching it on every login"""
+        header = Header.json_loads(JWS.from_compact(token).signature.protected)
+        key = jwks.find_key(
+            smart_str(header.kid),
+            smart_str(header.alg),
+            verify_kid=self.get_settings("OIDC_VERIFY_KID", True),
+        )
+        if key is None:
+            raise SuspiciousOperation("Could not find a valid JWKS.")
+        return key
+
+    def get_userinfo(self, access_token, id_token, payload):
+        """Return user details dictionary, over the pooled session"""
+        with time_oidc('userinfo'):
+            response = jwks.get_session().get(
+                self.OIDC_OP_USER_ENDPOINT,
+                headers={"Authorization": f"Bearer {access_token}"},
+                **jwks.request_kwargs()
+            )
+            response.raise_for_status()
+            return response.json()
+
     def create_user(self, claims):
         """Initialize user with Keycloak data on first login"""
         user = super().create_user(claims)
@@ -17,19 +81,41 @@ class KeycloakOIDCBackend(OIDCAuthenticationBackend):
         return user
 
     def _sync_user_data(self, user, claims):
-        """Common logic to sync user data from Keycloak claims"""
-        # Sync roles and permissions
-        roles = claims.get("realm_access", {}).get("roles", []) or []
-        if "user" in roles:
-            grp, _ = Group.objects.get_or_create(name="users")
-            user.groups.add(grp)
-        if "admin" in roles:
-            user.is_staff = True
-            user.is_superuser = True
-
-        # Sync user profile data
-        user.email = claims.get("email", user.email)
-        user.first_name = claims.get("given_name", "")
-        user.last_name = claims.get("family_name", "")
-
-        user.save()
+        """
+        Common logic to sync user data from Keycloak claims.
+        Only writes what changed, so a login with unchanged claims does no writes.
+        """
+        with time_oidc('sync_user'):
+            # Sync roles and permissions
+            roles = claims.get("realm_access", {}).get("roles", []) or []
+            if "user" in roles:
+                self._ensure_users_group(user)
+
+            updates = {
+                # Sync user profile data
+                'email': claims.get("email", user.email),
+                'first_name': claims.get("given_name", ""),
+                'last_name': claims.get("family_name", ""),
+            }
+            if "admin" in roles:
+                updates['is_staff'] = True
+                updates['is_superuser'] = True
+
+            changed = [field for field, value in updates.items() if getattr(user, field) != value]
+            for field in changed:
+                setattr(user, field, updates[field])
+            if changed:
+                user.save(update_fields=changed)
+
+    def _ensure_users_group(self, user):
+        """Add the user to the "users" group unless already a member"""
+        group_id = _users_group_id()
+        if user.groups.filter(pk=group_id).exists():
+            return
+        try:
+            with transaction.atomic():
+                user.groups.add(group_id)
+        except IntegrityError:
+            # The cached group was deleted, look it up again
+            _users_group_id.cache_clear()
+            user.groups.add(_users_group_id())
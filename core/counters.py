@@ -0,0 +1,114 @@
+# core/counters.py
+"""
+Denormalized membership counters on WorkingGroup and Topic.
+
+Every path that writes memberships records the level changes in a Deltas and
+applies them in the same transaction with a single relative UPDATE per table
+(``n = n + delta``), so concurrent changes never overwrite each other.
+Single toggles fold the same UPDATE into their write (update_counts_sql).
+reconcile() recounts from the membership tables to repair any drift.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+from .models import COUNTER_FIELDS, WorkingGroup, Topic
+
+ENTITY_MODELS = (WorkingGroup, Topic)
+
+
+class Deltas:
+    """Counter changes to apply, keyed by entity model and id"""
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: defaultdict(Counter))
+
+    def change(self, entity_model, entity_id, old_level=None, new_level=None, count=1):
+        """Record ``count`` memberships going from old_level to new_level (None: no membership)"""
+        if old_level == new_level:
+            return
+        counts = self.changes[entity_model][entity_id]
+        if old_level in COUNTER_FIELDS:
+            counts[COUNTER_FIELDS[old_level]] -= count
+        if new_level in COUNTER_FIELDS:
+            counts[COUNTER_FIELDS[new_level]] += count
+
+    def apply(self):
+        """Write the recorded changes, one UPDATE per entity table"""
+        for entity_model, entities in self.changes.items():
+            updates = {}
+            for field in COUNTER_FIELDS.values():
+                whens = [
+                    When(pk=entity_id, then=Value(counts[field]))
+                    for entity_id, counts in entities.items() if counts[field]
+                ]
+                if whens:
+                    delta = Case(*whens, default=Value(0), output_field=IntegerField())
+                    # Drift must not make a counter negative; reconcile() fixes it
+                    updates[field] = Greatest(F(field) + delta, Value(0))
+            if updates:
+                entity_model.objects.filter(pk__in=list(entities)).update(**updates)
+        self.changes.clear()
+
+
+def update_counts(entity_model, entity_id, old_level=None, new_level=None):
+    """Apply a single membership change to the counters"""
+    deltas = Deltas()
+    deltas.change(entity_model, entity_id, old_level, new_level)
+    deltas.apply()
+
+
+def update_counts_sql(entity_model, changes):
+    """
+    An UPDATE of the entity's counters for the single row of ``changes``, a
+    subquery or CTE with entity_id, old_level and new_level columns, for use
+    as a data-modifying CTE next to the membership write. Same rule as
+    Deltas.apply: a relative change that never goes below zero.
+    """
+    meta = entity_model._meta
+    table, pk = meta.db_table, meta.pk.column
+    assignments = ', '.join(
+        f'{field} = GREATEST({field} '
+        f"+ (c.new_level IS NOT DISTINCT FROM '{level}')::int "
+        f"- (c.old_level IS NOT DISTINCT FROM '{level}')::int, 0)"
+        for level, field in COUNTER_FIELDS.items()
+    )
+    return (
+        f'UPDATE {table} SET {assignments} FROM {changes} c '
+        f'WHERE {table}.{pk} = c.entity_id AND c.old_level IS DISTINCT FROM c.new_level'
+    )
+
+
+def drifted(entity_model):
+    """Entities whose counters differ from their memberships"""
+    actual = {
+        f'actual_{field}': Count('memberships', filter=Q(memberships__participation_level=level))
+        for level, field in COUNTER_FIELDS.items()
+    }
+    return entity_model.objects.annotate(**actual).exclude(
+        **{field: F(f'actual_{field}') for field in COUNTER_FIELDS.values()}
+    ).order_by('pk')
+
+
+def reconcile(entity_model, dry_run=False, batch_size=1000):
+    """
+    Recount the counters of the entities that drifted and return how many
+    there were. Each batch is recounted after locking its entity rows, so
+    memberships changed concurrently are counted exactly once.
+    """
+    ids = list(drifted(entity_model).values_list('pk', flat=True))
+    if dry_run:
+        return len(ids)
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            list(entity_model.objects.select_for_update().filter(pk__in=batch).values_list('pk', flat=True))
+            entities = list(drifted(entity_model).filter(pk__in=batch))
+            for entity in entities:
+                for field in COUNTER_FIELDS.values():
+                    setattr(entity, field, getattr(entity, f'actual_{field}'))
+            entity_model.objects.bulk_update(entities, list(COUNTER_FIELDS.values()))
+    return len(ids)
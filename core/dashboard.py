@@ -0,0 +1,107 @@
+# core/dashboard.py
+"""
+The "my participation" dashboard: every working group and topic membership
+of a user across all active projects.
+
+It is read from the participation facts with a single query on user_id
+(core_fact_user_idx) joining the project, working group and topic, and
+cached per user. The user's own writes through core/participation.py, ORM
+saves and deletes (core/signals.py) and bulk imports (core/importer.py)
+drop the cached entry; renames and deactivations are caught on read by
+comparing the versions of the projects it was built from.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from . import hierarchy
+from .metrics import record_cache
+from .models import ParticipationFact
+
+DASHBOARD_KEY = 'dashboard:{}'
+
+
+def _cache():
+    # Same cache as the hierarchy, whose project versions validate the entries
+    return caches[getattr(settings, 'HIERARCHY_CACHE_ALIAS', 'default')]
+
+
+def memberships_queryset(user_id):
+    """The user's memberships, with their project, working group and topic"""
+    return ParticipationFact.objects.filter(user_id=user_id).select_related(
+        'project', 'working_group', 'topic'
+    ).only(
+        'membership_type', 'entity_id', 'participation_level',
+        'project__name', 'project__is_active', 'working_group__name', 'topic__name',
+    ).order_by(
+        'project__name', 'working_group__name', 'working_group_id',
+        F('topic__name').asc(nulls_first=True), 'topic_id',
+    )
+
+
+def build_dashboard(user_id):
+    """
+    Return (projects, project_ids): the user's memberships in active projects
+    grouped as [{id, name, working_groups: [{id, name, level, level_display,
+    topics: [...]}]}], where a working group's level is None when the user
+    only follows some of its topics, and the ids of all the projects the
+    user has memberships in, inactive ones included
+    """
+    projects = []
+    project_ids = set()
+    working_groups = {}
+    for fact in memberships_queryset(user_id):
+        project_ids.add(fact.project_id)
+        if not fact.project.is_active:
+            continue
+        if not projects or projects[-1]['id'] != fact.project_id:
+            projects.append({'id': fact.project_id, 'name': fact.project.name, 'working_groups': []})
+        wg = working_groups.get(fact.working_group_id)
+        if wg is None:
+            wg = working_groups[fact.working_group_id] = {
+                'id': fact.working_group_id,
+                'name': fact.working_group.name,
+                'level': None,
+                'level_display': None,
+                'topics': [],
+            }
+            projects[-1]['working_groups'].append(wg)
+        if fact.topic_id is None:
+            wg['level'] = fact.participation_level
+            wg['level_display'] = fact.get_participation_level_display()
+        else:
+            wg['topics'].append({
+                'id': fact.topic_id,
+                'name': fact.topic.name,
+                'level': fact.participation_level,
+                'level_display': fact.get_participation_level_display(),
+            })
+    return projects, project_ids
+
+
+def get_dashboard(user_id):
+    """Return the projects of build_dashboard(user_id), cached until the user's memberships or their projects change"""
+    cache = _cache()
+    key = DASHBOARD_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is not None:
+        versions = hierarchy.project_versions(list(entry['versions']))
+        if versions == entry['versions']:
+            record_cache('dashboard', hits=1)
+            return entry['projects']
+
+    record_cache('dashboard', misses=1)
+    projects, project_ids = build_dashboard(user_id)
+    # Inactive projects are tracked too, so that reactivating one shows up
+    versions = hierarchy.project_versions(list(project_ids))
+    cache.set(key, {'versions': versions, 'projects': projects},
+              timeout=getattr(settings, 'HIERARCHY_CACHE_TIMEOUT', 300))
+    return projects
+
+
+def invalidate(*user_ids):
+    """Drop the users' cached dashboards once the surrounding transaction commits"""
+    keys = [DASHBOARD_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: _cache().delete_many(keys))
@@ -0,0 +1,224 @@
+# core/events.py
+"""
+Live participation updates as server-sent events, for the ASGI deployment.
+
+Membership writes send a NOTIFY on the ``participation`` channel from a
+trigger on the participation facts (migration 0005), with the changes of
+one project per notification. Each worker process holds a single LISTEN
+connection and fans the notifications out to the project's subscribers.
+
+EventsApplication wraps the Django ASGI application and serves the events
+URL itself: a subscriber is an asyncio queue rather than a request thread,
+and the database connection is only used briefly to check the session.
+Other requests go to Django, and so do events requests failing the checks
+of its middleware that matter here (ALLOWED_HOSTS, SECURE_SSL_REDIRECT),
+which Django then answers with a 400 or a redirect. Under WSGI, views.participation_events
+answers 204, which tells the browser not to reconnect.
+"""
+import asyncio
+import io
+import json
+import logging
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import HttpRequest
+from django.urls import Resolver404, resolve
+
+from .models import Project
+
+logger = logging.getLogger('core.events')
+
+CHANNEL = 'participation'
+
+# Seconds between keepalive comments, and reconnection delay for the browser (ms)
+KEEPALIVE = 20
+RETRY_MS = 5000
+# Events buffered per subscriber; a slower client is told to reload instead
+QUEUE_SIZE = 100
+# Seconds to wait before reconnecting the LISTEN connection
+LISTEN_RETRY = 5
+
+RELOAD = {'reload': True}
+
+
+class Broadcaster:
+    """Fan-out of the notifications of one LISTEN connection to per-project queues"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.task = None
+
+    def subscribe(self, project_id):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._listen())
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers[project_id].add(queue)
+        return queue
+
+    def unsubscribe(self, project_id, queue):
+        queues = self.subscribers.get(project_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[project_id]
+
+    def publish(self, project_id, event):
+        for queue in self.subscribers.get(project_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # The client missed events, have it start over
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RELOAD)
+
+    async def _listen(self):
+        """Forward notifications for as long as the process runs, reconnecting on errors"""
+        if connections['default'].vendor != 'postgresql':
+            return
+        import psycopg
+
+        params = connections['default'].get_connection_params()
+        # Set up for Django's sync cursors
+        params.pop('cursor_factory', None)
+        params.pop('context', None)
+        reconnecting = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**params, autocommit=True) as conn:
+                    await conn.execute(f'LISTEN {CHANNEL}')
+                    if reconnecting:
+                        # Notifications sent while disconnected are lost
+                        for project_id in list(self.subscribers):
+                            self.publish(project_id, RELOAD)
+                    reconnecting = False
+                    async for notify in conn.notifies():
+                        self._dispatch(notify.payload)
+            except (psycopg.Error, OSError):
+                logger.warning("LISTEN %s connection lost, reconnecting", CHANNEL, exc_info=True)
+            reconnecting = True
+            await asyncio.sleep(LISTEN_RETRY)
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+            project_id = int(event.pop('project'))
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed %s notification: %r", CHANNEL, payload)
+            return
+        self.publish(project_id, event)
+
+
+broadcaster = Broadcaster()
+
+
+def _authorize(session_key, project_id):
+    """
+    Return the username of the session if it may follow the project, or an
+    HTTP status code. Runs in a worker thread and releases its connection.
+    """
+    try:
+        request = HttpRequest()
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        user = get_user(request)
+        if not user.is_authenticated:
+            return 401
+        if not Project.objects.filter(pk=project_id, is_active=True).exists():
+            return 404
+        return user.username
+    finally:
+        connections.close_all()
+
+
+def _event(data):
+    return f'event: participation\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def participation_events(scope, receive, send, project_id):
+    """Stream the project's participation changes until the client goes away"""
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    session = cookies.get(settings.SESSION_COOKIE_NAME)
+    result = 401
+    if session is not None:
+        result = await sync_to_async(_authorize, thread_sensitive=False)(session.value, project_id)
+    if isinstance(result, int):
+        await send({'type': 'http.response.start', 'status': result, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # Do not let a proxy buffer the stream
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    queue = broadcaster.subscribe(project_id)
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n\n'.encode(), 'more_body': True})
+        while True:
+            event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({event, disconnected}, timeout=KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                event.cancel()
+                break
+            if event in done:
+                body = _event(event.result())
+            else:
+                event.cancel()
+                body = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        # The client went away while we were sending
+        pass
+    finally:
+        broadcaster.unsubscribe(project_id, queue)
+        disconnected.cancel()
+
+
+class EventsApplication:
+    """ASGI application serving the participation events and passing everything else to Django"""
+
+    def __init__(self, application):
+        self.application = application
+
+    @staticmethod
+    def allowed(scope):
+        """Whether the request passes Django's host validation and HTTPS requirement"""
+        request = ASGIRequest(scope, io.BytesIO())
+        try:
+            request.get_host()
+        except DisallowedHost:
+            return False
+        return request.is_secure() or not settings.SECURE_SSL_REDIRECT
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.view_name == 'core:participation_events' and self.allowed(scope):
+                return await participation_events(scope, receive, send, match.kwargs['pk'])
+        return await self.application(scope, receive, send)
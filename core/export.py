@@ -0,0 +1,177 @@
+# core/export.py
+"""
+File exports of the users participation matrix.
+
+Memberships are read from the participation facts through a server-side cursor
+(``.iterator(chunk_size=...)``) ordered by username, and written out in
+batches as they arrive, so memory stays bounded by the batch size whatever
+the number of users. Two layouts are available:
+
+- ``long``: one row per membership (user, working group, topic, level)
+- ``wide``: one row per user and one column per working group and topic,
+  like the HTML matrix
+
+Both are written as CSV or as Parquet; pyarrow is only imported by the first
+Parquet export.
+"""
+import csv
+import io
+from itertools import groupby
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+from . import matrix
+from .models import ParticipationFact
+
+LAYOUTS = ('long', 'wide')
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Rows fetched per round trip of the server-side cursor
+CHUNK_SIZE = 2000
+# Rows per CSV write / Parquet row group
+BATCH_SIZE = 10000
+
+USER_FIELDS = ['username', 'first_name', 'last_name']
+LONG_HEADER = USER_FIELDS + ['working_group', 'topic', 'level']
+
+
+class ExportError(ValueError):
+    pass
+
+
+def cells_queryset(project):
+    """
+    All memberships in the project, read from the participation facts, as
+    (username, first_name, last_name, membership_type, entity_id, level,
+    wg_name, topic_name) ordered by username and then column order.
+    """
+    return ParticipationFact.objects.filter(project=project).order_by(
+        'user__username', 'working_group__name', Coalesce('topic__name', Value(''))
+    ).values_list(
+        'user__username', 'user__first_name', 'user__last_name', 'membership_type', 'entity_id',
+        'participation_level', 'working_group__name', 'topic__name',
+    )
+
+
+def iter_long(cells):
+    """One row per membership"""
+    for username, first_name, last_name, _, _, level, wg_name, topic_name in cells:
+        yield username, first_name, last_name, wg_name, topic_name or '', level
+
+
+def iter_wide(cells, columns):
+    """One row per user, with the level letter of each column (or '')"""
+    positions = {(col['type'], col['id']): index for index, col in enumerate(columns)}
+    for user, user_cells in groupby(cells, key=itemgetter(0, 1, 2)):
+        statuses = [''] * len(columns)
+        for _, _, _, membership_type, entity_id, level, _, _ in user_cells:
+            # Skip entities created after the columns were read
+            index = positions.get((matrix.COLUMN_TYPES[membership_type], entity_id))
+            if index is not None:
+                statuses[index] = matrix.LEVEL_LETTERS.get(level, '')
+        yield (*user, *statuses)
+
+
+def write_csv(header, rows, batch_size=BATCH_SIZE):
+    """Yield the CSV text in batches of ``batch_size`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in matrix.iter_chunks(rows, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ParquetSink:
+    """Write-only file object handing back what the Parquet writer wrote so far"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def write_parquet(header, rows, batch_size=BATCH_SIZE):
+    """Yield the Parquet file in parts, one row group of ``batch_size`` rows at a time"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.string()) for name in header])
+    sink = _ParquetSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in matrix.iter_chunks(rows, batch_size):
+            # Empty cells are nulls rather than empty strings in Parquet
+            arrays = [pa.array([row[i] or None for row in batch], pa.string()) for i in range(len(header))]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def export(project, layout='long', file_format='csv', chunk_size=CHUNK_SIZE):
+    """
+    Return a lazy iterator over the export of ``project`` (str parts for CSV,
+    bytes for Parquet). Nothing is queried until it is iterated.
+    Raises ExportError for an unknown layout or format.
+    """
+    if layout not in LAYOUTS:
+        raise ExportError(f"Unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+    if file_format not in FORMATS:
+        raise ExportError(f"Unknown format {file_format!r}, expected one of {', '.join(FORMATS)}")
+    write = write_parquet if file_format == 'parquet' else write_csv
+
+    def generate():
+        cells = cells_queryset(project).iterator(chunk_size=chunk_size)
+        if layout == 'long':
+            yield from write(LONG_HEADER, iter_long(cells))
+        else:
+            columns = matrix.build_columns(project)
+            yield from write(USER_FIELDS + [col['name'] for col in columns], iter_wide(cells, columns))
+
+    return generate()
+
+
+def filename(project, layout, file_format):
+    return f"participation-{project.pk}-{layout}.{FORMATS[file_format][1]}"
+
+
+async def astream(parts):
+    """
+    Iterate a sync export from async code. Each part is produced in the
+    request's sync thread, so the server-side cursor stays on one connection.
+    """
+    iterator = iter(parts)
+    next_part = sync_to_async(next)
+    while True:
+        part = await next_part(iterator, None)
+        if part is None:
+            return
+        yield part
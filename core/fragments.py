@@ -0,0 +1,95 @@
+# core/fragments.py
+"""
+Rendered fragments shared by all users.
+
+The participation table of a project is rendered once per project version
+with a marker in place of each per-user cell, and cached. Each request then
+only substitutes the markers with the user's cells, which are rendered once
+per (entity type, cell, level) rather than once per entity, so the cost of a
+request barely depends on the project size. Leader changes bump the project
+version (see core/signals.py).
+
+The same cell renders are sent to the page (slot_templates) so that it can
+patch cells in place on live updates (see core/events.py).
+"""
+import re
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from . import hierarchy
+from .metrics import record_cache
+from .participation import LEVEL_DISPLAY, WORKING_GROUP, TOPIC, get_leaders
+
+PARTICIPATION_TABLE_KEY = 'fragments:participation_table:v2:{}:{}'
+PARTICIPATION_SLOT = re.compile(r'<!--participation:(working_group|topic):(\d+):(status|actions)-->')
+
+# Stands in for the entity id while rendering a cell, replaced per entity
+_ENTITY_ID = '__entity_id__'
+
+SLOT_LEVELS = (None, *LEVEL_DISPLAY)
+
+
+def _cache():
+    # Same cache as the hierarchy, whose project versions key the fragments
+    return caches[getattr(settings, 'HIERARCHY_CACHE_ALIAS', 'default')]
+
+
+def participation_table(project):
+    """Return the shared HTML of a cached project tree's participation table"""
+    cache = _cache()
+    key = PARTICIPATION_TABLE_KEY.format(project['id'], hierarchy.project_version(project['id']))
+    html = cache.get(key)
+    if html is not None:
+        record_cache('fragments', hits=1)
+        return html
+
+    record_cache('fragments', misses=1)
+    leaders = get_leaders(project['id'])
+    working_groups = project['working_groups']
+    for wg in working_groups:
+        wg['leader_membership'] = leaders.get((WORKING_GROUP, wg['id']))
+        for topic in wg['topics']:
+            topic['leader_membership'] = leaders.get((TOPIC, topic['id']))
+    html = render_to_string('core/project_participation_table_shared.html', {
+        'working_groups': working_groups,
+    })
+    cache.set(key, html, timeout=getattr(settings, 'HIERARCHY_CACHE_TIMEOUT', 300))
+    return html
+
+
+@cache
+def slot_templates():
+    """
+    Return the per-user cells for every entity type, slot and level, keyed
+    'type:slot:level' (empty level when not participating), with
+    ``__entity_id__`` in place of the entity id
+    """
+    template = get_template('core/project_participation_table_slot.html')
+    return {
+        f'{entity_type}:{slot}:{level or ""}': template.render({
+            'entity_type': entity_type,
+            'entity_id': _ENTITY_ID,
+            'slot': slot,
+            'level': level,
+            'level_display': LEVEL_DISPLAY.get(level),
+        }).strip()
+        for entity_type in (WORKING_GROUP, TOPIC)
+        for slot in ('status', 'actions')
+        for level in SLOT_LEVELS
+    }
+
+
+def overlay_participation(html, participation):
+    """Fill the per-user cells of a shared participation table from a ParticipationIndex"""
+    cells = slot_templates()
+
+    def cell(match):
+        entity_type, entity_id, slot = match.groups()
+        level = participation.level(entity_type, int(entity_id))
+        return cells[f'{entity_type}:{slot}:{level or ""}'].replace(_ENTITY_ID, entity_id)
+
+    return mark_safe(PARTICIPATION_SLOT.sub(cell, html))
@@ -0,0 +1,192 @@
+# core/hierarchy.py
+"""
+Versioned cache of the Project -> WorkingGroup -> Topic structure.
+
+Each project's tree is stored as a compact dict under a key containing the
+project's version counter; the list of projects is stored under a global
+index version. Counters are bumped by the signals in ``core.signals``, so a
+change simply makes the old keys unreachable and they expire on their own.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+
+from .metrics import record_cache
+from .models import Project
+
+INDEX_VERSION_KEY = 'hierarchy:index:version'
+PROJECT_VERSION_KEY = 'hierarchy:project:{}:version'
+HITS_KEY = 'hierarchy:hits'
+MISSES_KEY = 'hierarchy:misses'
+
+
+def _cache():
+    return caches[getattr(settings, 'HIERARCHY_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'HIERARCHY_CACHE_TIMEOUT', 300)
+
+
+def _incr(key, delta=1):
+    """Increment a counter key, creating it when missing or evicted"""
+    cache = _cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def _get_version(key):
+    """
+    Return a version counter, initialising it when missing. A fresh counter
+    starts from the current time so it never reuses a version of an evicted one.
+    """
+    cache = _cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+
+
+def bump_index():
+    """Invalidate the cached list of projects"""
+    _bump_version(INDEX_VERSION_KEY)
+
+
+def bump_project(project_id):
+    """Invalidate the cached tree of one project"""
+    _bump_version(PROJECT_VERSION_KEY.format(project_id))
+
+
+def project_version(project_id):
+    """Return the current version counter of a project's tree"""
+    return _get_version(PROJECT_VERSION_KEY.format(project_id))
+
+
+def project_versions(project_ids):
+    """Return {project_id: version} with a single cache round-trip when all are set"""
+    keys = {PROJECT_VERSION_KEY.format(project_id): project_id for project_id in project_ids}
+    found = _cache().get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, project_id in keys.items():
+        if project_id not in versions:
+            versions[project_id] = _get_version(key)
+    return versions
+
+
+def cache_stats():
+    """Return the hit/miss counters of the hierarchy cache"""
+    values = _cache().get_many([HITS_KEY, MISSES_KEY])
+    return {'hits': values.get(HITS_KEY, 0), 'misses': values.get(MISSES_KEY, 0)}
+
+
+def serialize_project(project):
+    """Serialize a project with prefetched working groups and topics"""
+    return {
+        'id': project.id,
+        'name': project.name,
+        'description': project.description,
+        'is_active': project.is_active,
+        'working_groups': [
+            {
+                'id': wg.id,
+                'name': wg.name,
+                'description': wg.description,
+                'topics': [
+                    {'id': topic.id, 'name': topic.name, 'description': topic.description}
+                    for topic in wg.topics.all()
+                ],
+            }
+            for wg in project.working_groups.all()
+        ],
+    }
+
+
+def _load_projects(project_ids):
+    projects = Project.objects.filter(pk__in=project_ids).prefetch_related(
+        'working_groups',
+        'working_groups__topics',
+    )
+    return {project.id: serialize_project(project) for project in projects}
+
+
+def load_project_tree(project_id):
+    """Read one project's tree from the database, bypassing the cache; None if it does not exist"""
+    return _load_projects([project_id]).get(project_id)
+
+
+def load_project_index():
+    """Read the list returned by get_project_index from the database, bypassing the cache"""
+    return list(
+        Project.objects.annotate(working_group_count=Count('working_groups')).order_by('name').values(
+            'id', 'name', 'description', 'is_active', 'working_group_count'
+        )
+    )
+
+
+def get_project_trees(project_ids):
+    """
+    Return {project_id: tree} for the given ids, loading only the missing
+    trees from the database. Unknown ids are left out.
+    """
+    cache = _cache()
+    project_ids = list(project_ids)
+    versions = project_versions(project_ids)
+    keys = {
+        f'hierarchy:project:{project_id}:tree:{versions[project_id]}': project_id
+        for project_id in project_ids
+    }
+    cached = cache.get_many(list(keys))
+    trees = {keys[key]: tree for key, tree in cached.items()}
+
+    missing = [project_id for project_id in project_ids if project_id not in trees]
+    record_cache('hierarchy', hits=len(cached), misses=len(missing))
+    if cached:
+        _incr(HITS_KEY, len(cached))
+    if missing:
+        _incr(MISSES_KEY, len(missing))
+        loaded = _load_projects(missing)
+        cache.set_many(
+            {key: loaded[project_id] for key, project_id in keys.items() if project_id in loaded},
+            timeout=_timeout(),
+        )
+        trees.update(loaded)
+    return trees
+
+
+def get_project_tree(project_id):
+    """Return the cached tree of one project, or None if it does not exist"""
+    return get_project_trees([project_id]).get(project_id)
+
+
+def get_project_index():
+    """
+    Return the list of all projects ordered by name as
+    {'id', 'name', 'description', 'is_active', 'working_group_count'} dicts.
+    """
+    cache = _cache()
+    key = f'hierarchy:index:{_get_version(INDEX_VERSION_KEY)}'
+    index = cache.get(key)
+    if index is not None:
+        record_cache('hierarchy', hits=1)
+        _incr(HITS_KEY)
+        return index
+
+    record_cache('hierarchy', misses=1)
+    _incr(MISSES_KEY)
+    index = load_project_index()
+    cache.set(key, index, timeout=_timeout())
+    return index
@@ -0,0 +1,280 @@
+# core/importer.py
+"""
+Bulk import of memberships from CSV or JSONL records of
+(username, project, working_group, topic, level); rows with an empty topic
+are working group memberships.
+
+Names are resolved to ids with in-memory maps loaded once, the resolved rows
+are streamed into a temporary table with COPY (PostgreSQL) and merged into the
+membership tables with one INSERT ... ON CONFLICT DO UPDATE per table. When a
+file lists the same membership twice, the last row wins. The level changes
+are computed in SQL before the merge; they make the dry-run report and update
+the membership counters in the same transaction. The cached dashboards of
+the users whose memberships changed are dropped on commit.
+"""
+import csv
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import dashboard, hierarchy
+from .counters import Deltas
+from .models import Project, WorkingGroup, Topic, WorkingGroupMembership
+from .participation import MEMBERSHIP_TABLES, WORKING_GROUP, TOPIC, table_sql
+
+User = get_user_model()
+
+FIELDS = ['username', 'project', 'working_group', 'topic', 'level']
+LEVELS = {level for level, _ in WorkingGroupMembership.PARTICIPATION_CHOICES}
+
+# Staged rows: entity types are stored as small integers
+KINDS = {WORKING_GROUP: 0, TOPIC: 1}
+
+STAGE_TABLE = 'import_membership_rows'
+DEDUPED_TABLE = 'import_memberships'
+
+# Rows per INSERT when COPY is not available
+INSERT_BATCH_SIZE = 5000
+
+
+class ImportDataError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    # (line, message) of the rows that could not be resolved
+    errors: list = field(default_factory=list)
+    # entity_type -> Counter of 'created', 'updated', 'unchanged'
+    changes: dict = field(default_factory=lambda: {WORKING_GROUP: Counter(), TOPIC: Counter()})
+    # (entity_type, username, entity_id, old level, new level) samples of the changes
+    samples: list = field(default_factory=list)
+
+
+def read_records(stream, file_format):
+    """Yield (line number, record dict) from a CSV (with a header) or JSONL text stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        missing = set(FIELDS) - {'project'} - set(reader.fieldnames or [])
+        if missing:
+            raise ImportDataError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+        for record in reader:
+            yield reader.line_num, record
+    elif file_format == 'jsonl':
+        for line_num, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ImportDataError(f"Line {line_num}: invalid JSON ({e})")
+            if not isinstance(record, dict):
+                raise ImportDataError(f"Line {line_num}: expected a JSON object")
+            yield line_num, record
+    else:
+        raise ImportDataError(f"Unknown format {file_format!r}, expected csv or jsonl")
+
+
+class Resolver:
+    """Name -> id maps of users, projects, working groups and topics, each loaded with one query"""
+
+    def __init__(self, default_project=None):
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.projects = dict(Project.objects.values_list('name', 'pk'))
+        self.working_groups = {
+            (project_id, name): pk for pk, project_id, name in WorkingGroup.objects.values_list('pk', 'project_id', 'name')
+        }
+        self.topics = {
+            (wg_id, name): pk for pk, wg_id, name in Topic.objects.values_list('pk', 'working_group_id', 'name')
+        }
+        self.default_project = default_project
+
+    def resolve(self, record):
+        """Return (entity_type, user_id, entity_id, level) or raise ImportDataError"""
+        def value(name):
+            return str(record.get(name) or '').strip()
+
+        level = value('level').lower()
+        if level not in LEVELS:
+            raise ImportDataError(f"Invalid level {value('level')!r}")
+        user_id = self.users.get(value('username'))
+        if user_id is None:
+            raise ImportDataError(f"Unknown user {value('username')!r}")
+        project_name = value('project') or self.default_project
+        if not project_name:
+            raise ImportDataError("Missing project")
+        project_id = self.projects.get(project_name)
+        if project_id is None:
+            raise ImportDataError(f"Unknown project {project_name!r}")
+        wg_id = self.working_groups.get((project_id, value('working_group')))
+        if wg_id is None:
+            raise ImportDataError(f"Unknown working group {value('working_group')!r} in {project_name!r}")
+        if not value('topic'):
+            return WORKING_GROUP, user_id, wg_id, level
+        topic_id = self.topics.get((wg_id, value('topic')))
+        if topic_id is None:
+            raise ImportDataError(f"Unknown topic {value('topic')!r} in {value('working_group')!r}")
+        return TOPIC, user_id, topic_id, level
+
+
+def import_memberships(records, default_project=None, dry_run=False, skip_invalid=False, samples=20):
+    """
+    Import (line, record) pairs from read_records and return an ImportResult.
+
+    Unless ``skip_invalid``, nothing is written when a row cannot be
+    resolved. Levels are set as given, leaders included. With ``dry_run``
+    the changes are computed and reported but not applied. On PostgreSQL the
+    membership tables are locked against concurrent writes (reads go on) for
+    the duration of the merge.
+    """
+    result = ImportResult()
+    resolver = Resolver(default_project)
+
+    def staged_rows():
+        for line, record in records:
+            result.rows += 1
+            try:
+                entity_type, user_id, entity_id, level = resolver.resolve(record)
+            except ImportDataError as e:
+                result.errors.append((line, str(e)))
+                continue
+            yield line, KINDS[entity_type], user_id, entity_id, level
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {STAGE_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {DEDUPED_TABLE}')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {STAGE_TABLE} '
+            f'(line bigint, kind smallint, user_id integer, entity_id bigint, level varchar(20))'
+        )
+        _load(cursor, staged_rows())
+        if result.errors and not skip_invalid:
+            transaction.set_rollback(True)
+            return result
+
+        # Last row wins for memberships listed more than once
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {DEDUPED_TABLE} AS '
+            f'SELECT kind, user_id, entity_id, level FROM ('
+            f'  SELECT kind, user_id, entity_id, level, ROW_NUMBER() OVER ('
+            f'    PARTITION BY kind, user_id, entity_id ORDER BY line DESC'
+            f'  ) AS n FROM {STAGE_TABLE}'
+            f') ranked WHERE n = 1'
+        )
+        cursor.execute(f'CREATE INDEX {DEDUPED_TABLE}_idx ON {DEDUPED_TABLE} (kind, user_id, entity_id)')
+
+        if connection.vendor == 'postgresql':
+            # Temporary tables are never analyzed by autovacuum
+            cursor.execute(f'ANALYZE {DEDUPED_TABLE}')
+            tables = ', '.join(table_sql(entity_type)[0] for entity_type in MEMBERSHIP_TABLES)
+            cursor.execute(f'LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE')
+
+        deltas = Deltas()
+        leader_entities = {entity_type: set() for entity_type in MEMBERSHIP_TABLES}
+        user_ids = set()
+        now = timezone.now()
+        for entity_type in MEMBERSHIP_TABLES:
+            _diff(cursor, entity_type, result, deltas, leader_entities[entity_type], samples)
+            if not dry_run:
+                user_ids.update(_merge(cursor, entity_type, now))
+
+        cursor.execute(f'DROP TABLE {DEDUPED_TABLE}')
+        cursor.execute(f'DROP TABLE {STAGE_TABLE}')
+        if dry_run:
+            transaction.set_rollback(True)
+            return result
+
+        deltas.apply()
+        dashboard.invalidate(*user_ids)
+        # Leaders are part of the cached participation table
+        project_ids = _projects_of(leader_entities)
+
+        def bump():
+            for project_id in project_ids:
+                hierarchy.bump_project(project_id)
+        transaction.on_commit(bump)
+    return result
+
+
+def _load(cursor, rows):
+    """Stream the rows into the staging table"""
+    columns = '(line, kind, user_id, entity_id, level)'
+    if connection.vendor == 'postgresql':
+        with cursor.copy(f'COPY {STAGE_TABLE} {columns} FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(row)
+        return
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            cursor.executemany(f'INSERT INTO {STAGE_TABLE} {columns} VALUES (%s, %s, %s, %s, %s)', batch)
+            batch = []
+    if batch:
+        cursor.executemany(f'INSERT INTO {STAGE_TABLE} {columns} VALUES (%s, %s, %s, %s, %s)', batch)
+
+
+def _diff(cursor, entity_type, result, deltas, leader_entities, samples):
+    """Count the level changes the merge makes per entity and record them in ``deltas``"""
+    table, entity_column, user_column = table_sql(entity_type)
+    entity_model = MEMBERSHIP_TABLES[entity_type][1]
+    join = (
+        f'FROM {DEDUPED_TABLE} i JOIN {User._meta.db_table} u ON u.{User._meta.pk.column} = i.user_id '
+        f'LEFT JOIN {table} m '
+        f'ON m.{user_column} = i.user_id AND m.{entity_column} = i.entity_id '
+        f'WHERE i.kind = %s'
+    )
+    changed = 'AND (m.participation_level IS NULL OR m.participation_level <> i.level)'
+    cursor.execute(
+        f'SELECT i.entity_id, m.participation_level, i.level, COUNT(*) {join} {changed} '
+        f'GROUP BY i.entity_id, m.participation_level, i.level',
+        [KINDS[entity_type]],
+    )
+    counts = result.changes[entity_type]
+    for entity_id, old_level, new_level, count in cursor.fetchall():
+        counts['updated' if old_level else 'created'] += count
+        deltas.change(entity_model, entity_id, old_level, new_level, count)
+        if 'leader' in (old_level, new_level):
+            leader_entities.add(entity_id)
+
+    cursor.execute(f'SELECT COUNT(*) FROM {DEDUPED_TABLE} WHERE kind = %s', [KINDS[entity_type]])
+    counts['unchanged'] = cursor.fetchone()[0] - counts['created'] - counts['updated']
+
+    if samples:
+        cursor.execute(
+            f'SELECT u.username, i.entity_id, m.participation_level, i.level {join} {changed} '
+            f'ORDER BY i.user_id, i.entity_id LIMIT %s',
+            [KINDS[entity_type], samples],
+        )
+        result.samples.extend((entity_type, *row) for row in cursor.fetchall())
+
+
+def _merge(cursor, entity_type, now):
+    """Insert new memberships and update the levels that changed; return the ids of their users"""
+    table, entity_column, user_column = table_sql(entity_type)
+    cursor.execute(
+        f'WITH merged AS ('
+        f'  INSERT INTO {table} ({user_column}, {entity_column}, participation_level, created_at, updated_at) '
+        f'  SELECT user_id, entity_id, level, %s, %s FROM {DEDUPED_TABLE} WHERE kind = %s '
+        f'  ON CONFLICT ({user_column}, {entity_column}) DO UPDATE '
+        f'  SET participation_level = EXCLUDED.participation_level, updated_at = EXCLUDED.updated_at '
+        f'  WHERE {table}.participation_level <> EXCLUDED.participation_level '
+        f'  RETURNING {user_column}'
+        f') SELECT DISTINCT {user_column} FROM merged',
+        [now, now, KINDS[entity_type]],
+    )
+    return {user_id for user_id, in cursor.fetchall()}
+
+
+def _projects_of(entities):
+    """Project ids of {entity_type: entity ids}"""
+    project_ids = set(WorkingGroup.objects.filter(pk__in=entities[WORKING_GROUP]).values_list('project_id', flat=True))
+    project_ids.update(Topic.objects.filter(pk__in=entities[TOPIC]).values_list(
+        'working_group__project_id', flat=True
+    ))
+    return project_ids
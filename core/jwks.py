@@ -0,0 +1,157 @@
+# core/jwks.py
+"""
+Cached JWKS for KeycloakOIDCBackend, plus a pooled requests.Session for the
+calls to Keycloak.
+
+The JWKS is kept in Django's cache (shared by the workers when REDIS_URL is
+set) and in a per-process copy. A copy older than OIDC_JWKS_CACHE_TTL is
+still served for OIDC_JWKS_STALE_TTL more seconds while a background thread
+refreshes it; an unknown ``kid`` forces a refresh, at most once every
+OIDC_JWKS_MIN_REFRESH_INTERVAL seconds.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+
+from .metrics import time_oidc
+
+logger = logging.getLogger('core.jwks')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide requests.Session used to talk to Keycloak"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=getattr(settings, 'OIDC_HTTP_POOL_SIZE', 10))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def request_kwargs():
+    """requests options shared by every call to the OP, from the mozilla_django_oidc settings"""
+    return {
+        'verify': getattr(settings, 'OIDC_VERIFY_SSL', True),
+        'timeout': getattr(settings, 'OIDC_TIMEOUT', None),
+        'proxies': getattr(settings, 'OIDC_PROXY', None),
+    }
+
+
+def _cache():
+    return caches[getattr(settings, 'OIDC_JWKS_CACHE_ALIAS', 'default')]
+
+
+class CachedDocument:
+    """A JSON document fetched from the OP and cached with stale-while-revalidate"""
+
+    def __init__(self, name, get_url):
+        self.name = name
+        self.key = f'oidc:{name}'
+        self.get_url = get_url
+        self._local = None
+        self._refreshing = threading.Lock()
+        self._last_forced = 0.0
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'OIDC_JWKS_CACHE_TTL', 3600)
+
+    @property
+    def stale_ttl(self):
+        return getattr(settings, 'OIDC_JWKS_STALE_TTL', 86400)
+
+    def get(self):
+        """Return the document, fetching it only when missing or too old"""
+        entry = self._entry()
+        if entry is None:
+            return self._fetch()['data']
+
+        age = time.time() - entry['fetched_at']
+        if age < self.ttl:
+            return entry['data']
+        if age < self.ttl + self.stale_ttl:
+            self._refresh_in_background()
+            return entry['data']
+        return self._fetch()['data']
+
+    def refresh(self):
+        """Fetch the document now, unless that was already done very recently"""
+        min_interval = getattr(settings, 'OIDC_JWKS_MIN_REFRESH_INTERVAL', 30)
+        now = time.time()
+        if now - self._last_forced < min_interval:
+            return self.get()
+        self._last_forced = now
+        return self._fetch()['data']
+
+    def _entry(self):
+        local = self._local
+        if local is not None and time.time() - local['fetched_at'] < self.ttl:
+            return local
+        entry = _cache().get(self.key)
+        if entry is not None and (local is None or entry['fetched_at'] > local['fetched_at']):
+            self._local = entry
+            return entry
+        return local
+
+    def _fetch(self):
+        with time_oidc(f'{self.name}_fetch'):
+            response = get_session().get(self.get_url(), **request_kwargs())
+        response.raise_for_status()
+        entry = {'data': response.json(), 'fetched_at': time.time()}
+        _cache().set(self.key, entry, timeout=self.ttl + self.stale_ttl)
+        self._local = entry
+        return entry
+
+    def _refresh_in_background(self):
+        # One refresh per process, and per cache when it is shared
+        if not self._refreshing.acquire(blocking=False):
+            return
+        lock_key = f'{self.key}:refreshing'
+        if not _cache().add(lock_key, 1, timeout=30):
+            self._refreshing.release()
+            return
+
+        def run():
+            try:
+                self._fetch()
+            except Exception:
+                logger.warning("Background refresh of %s failed, serving the stale copy", self.name, exc_info=True)
+            finally:
+                _cache().delete(lock_key)
+                self._refreshing.release()
+
+        threading.Thread(target=run, name=f'{self.name}-refresh', daemon=True).start()
+
+
+jwks = CachedDocument('jwks', lambda: settings.OIDC_OP_JWKS_ENDPOINT)
+
+
+def _match(document, kid, alg, verify_kid):
+    key = None
+    for jwk in document.get('keys', []):
+        if verify_kid and jwk.get('kid') != kid:
+            continue
+        if 'alg' in jwk and jwk['alg'] != alg:
+            continue
+        key = jwk
+    return key
+
+
+def find_key(kid, alg, verify_kid=True):
+    """Return the JWK matching a token header, refreshing the JWKS once on a miss"""
+    key = _match(jwks.get(), kid, alg, verify_kid)
+    if key is None:
+        key = _match(jwks.refresh(), kid, alg, verify_kid)
+    return key
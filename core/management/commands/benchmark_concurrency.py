@@ -0,0 +1,177 @@
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core.management.commands.benchmark_views import percentile
+from core.models import Project, Topic
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with concurrent clients and report throughput and "
+        "latency per page. Run it against the WSGI and the ASGI deployment to "
+        "compare them; --slow-clients adds connections that send their headers "
+        "slowly, which tie up a sync worker but not an async one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help='Base URL of the server')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request (repeatable)')
+        parser.add_argument('--user', help='Username to log in as (default: the first user)')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load')
+        parser.add_argument('--slow-clients', type=int, default=0)
+        parser.add_argument('--slow-seconds', type=float, default=5,
+                            help='Seconds a slow client takes to send its request headers')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be positive")
+        user = self._user(options['user'])
+        base_url = options['url'].rstrip('/')
+        paths = options['paths'] or self._default_paths()
+        cookie = {settings.SESSION_COOKIE_NAME: self._session(user)}
+        # The server only sees plain HTTP; claim TLS as the ingress would
+        headers = {'X-Forwarded-Proto': 'https'}
+
+        self.stdout.write(
+            f"{base_url} as {user.username}: {options['concurrency']} clients, "
+            f"{options['slow_clients']} slow clients, {options['duration']:.0f}s"
+        )
+        results = {path: [] for path in paths}
+        errors = {path: 0 for path in paths}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+        stop = threading.Event()
+
+        def client(worker):
+            session = requests.Session()
+            session.cookies.update(cookie)
+            i = worker
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    response = session.get(base_url + path, headers=headers, timeout=options['timeout'],
+                                           allow_redirects=False)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        results[path].append(elapsed)
+                    else:
+                        errors[path] += 1
+
+        slow_threads = [
+            threading.Thread(target=self._slow_client, args=(base_url, paths[0], stop, options), daemon=True)
+            for _ in range(options['slow_clients'])
+        ]
+        for thread in slow_threads:
+            thread.start()
+        if slow_threads:
+            # Let the slow clients take their connections first
+            time.sleep(0.5)
+            deadline += 0.5
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for worker in range(options['concurrency']):
+                executor.submit(client, worker)
+        elapsed = time.monotonic() - start
+        stop.set()
+
+        self._report(results, errors, elapsed)
+
+    def _report(self, results, errors, elapsed):
+        self.stdout.write(f"{'path':<45} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        all_latencies = []
+        for path, latencies in results.items():
+            all_latencies.extend(latencies)
+            self._line(path, latencies, errors[path], elapsed)
+        self._line('total', all_latencies, sum(errors.values()), elapsed)
+
+    def _line(self, label, latencies, error_count, elapsed):
+        p50 = statistics.median(latencies) if latencies else 0
+        p95 = percentile(latencies, 95) if latencies else 0
+        self.stdout.write(
+            f"{label:<45} {len(latencies):>8} {error_count:>7} {len(latencies) / elapsed:>8.1f} "
+            f"{p50:>9.1f} {p95:>9.1f}"
+        )
+
+    def _slow_client(self, base_url, path, stop, options):
+        """Send a request one header line at a time, over --slow-seconds, until stopped"""
+        url = urlsplit(base_url)
+        lines = [
+            f'GET {path} HTTP/1.1',
+            f'Host: {url.netloc}',
+            'X-Forwarded-Proto: https',
+            'User-Agent: benchmark_concurrency slow client',
+            'Accept: text/html',
+            'Connection: close',
+        ]
+        pause = options['slow_seconds'] / len(lines)
+        while not stop.is_set():
+            try:
+                with socket.create_connection((url.hostname, url.port or 80), timeout=options['timeout']) as sock:
+                    for line in lines:
+                        sock.sendall(f'{line}\r\n'.encode())
+                        if stop.wait(pause):
+                            break
+                    sock.sendall(b'\r\n')
+                    while sock.recv(65536):
+                        pass
+            except OSError:
+                stop.wait(0.1)
+
+    def _user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} does not exist")
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("No users, run seed_scale first")
+        return user
+
+    def _session(self, user):
+        """Create a logged-in session for ``user`` and return its key"""
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def _default_paths(self):
+        """The pages that have async versions, on the first active project"""
+        project = Project.objects.filter(is_active=True).order_by('pk').first()
+        if project is None:
+            raise CommandError("No active projects, run seed_scale first")
+        paths = [
+            reverse('core:project_list'),
+            reverse('core:project_detail', args=[project.id]),
+            f"{reverse('core:project_participation_table')}?project={project.id}",
+            f"{reverse('core:users_participation_matrix')}?project={project.id}",
+        ]
+        topic = Topic.objects.filter(working_group__project=project).order_by('pk').first()
+        if topic is not None:
+            paths.append(reverse('core:topic_detail', args=[topic.id]))
+        return paths
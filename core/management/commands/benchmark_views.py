@@ -0,0 +1,186 @@
+import statistics
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from core import urls as core_urls
+from core.models import Project, Topic, TopicMembership
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every core.urls view through the test client and report p50/p95 "
+        "latency, query count and peak Python memory per view. With "
+        "ASYNC_VIEWS=True the async views are benchmarked, through the async "
+        "test client."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--project', type=int, help='Project id (default: the one with most WGs)')
+        parser.add_argument('--user', help='Username (default: the one with most topic memberships)')
+        parser.add_argument('--view', action='append', dest='views', help='Only benchmark this view (repeatable)')
+
+    def handle(self, *args, **options):
+        project = self._project(options['project'])
+        user = self._user(options['user'])
+        self.stdout.write(f"Project: {project} (id={project.id}), user: {user.username} (id={user.id})")
+        self.stdout.write(f"Views: {'async' if settings.ASYNC_VIEWS else 'sync'}")
+
+        client = AsyncClient() if settings.ASYNC_VIEWS else Client()
+        client.force_login(user)
+        requests = self._requests(project, user)
+
+        missing = [p.name for p in core_urls.urlpatterns if p.name not in requests]
+        if missing:
+            self.stdout.write(self.style.WARNING(f"No benchmark request for: {', '.join(missing)}"))
+
+        self.stdout.write(f"{'view':<30} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>9} status")
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, make_request in requests.items():
+                if options['views'] and name not in options['views']:
+                    continue
+                self._benchmark(client, name, make_request, options['iterations'], options['warmup'])
+
+    def _benchmark(self, client, name, make_request, iterations, warmup):
+        for i in range(warmup):
+            self._run(client, make_request, i)
+
+        latencies = [self._run(client, make_request, i)[1] for i in range(iterations)]
+
+        # Queries and memory are measured on a separate run, outside the timings
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            status, _ = self._run(client, make_request, iterations)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f"{name:<30} {statistics.median(latencies):>9.1f} {percentile(latencies, 95):>9.1f} "
+            f"{len(queries):>8} {peak / 1024:>9.0f} {status}"
+        )
+
+    def _run(self, client, make_request, iteration):
+        """Issue one request and read its body, returning (status, milliseconds)"""
+        if isinstance(client, AsyncClient):
+            return async_to_sync(self._arun)(client, make_request, iteration)
+        start = time.perf_counter()
+        response = make_request(client, iteration)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    async def _arun(self, client, make_request, iteration):
+        # Timed inside the event loop, leaving out async_to_sync's own cost
+        start = time.perf_counter()
+        response = await make_request(client, iteration)
+        if response.streaming:
+            if response.is_async:
+                async for _ in response.streaming_content:
+                    pass
+            else:
+                for _ in response.streaming_content:
+                    pass
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    def _project(self, project_id):
+        if project_id:
+            try:
+                return Project.objects.get(pk=project_id)
+            except Project.DoesNotExist:
+                raise CommandError(f"Project {project_id} does not exist")
+        project = Project.objects.filter(is_active=True).annotate(
+            wg_count=Count('working_groups')
+        ).order_by('-wg_count').first()
+        if project is None:
+            raise CommandError("No active projects, run seed_scale first")
+        return project
+
+    def _user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} does not exist")
+        user = User.objects.annotate(n=Count('topic_memberships')).order_by('-n').first()
+        if user is None:
+            raise CommandError("No users, run seed_scale first")
+        return user
+
+    def _requests(self, project, user):
+        """url name -> callable(client, iteration) issuing one request"""
+        wg = project.working_groups.first()
+        topic = Topic.objects.filter(working_group__project=project).first()
+        # A topic the user is not a member of, toggled back and forth
+        free_topic = Topic.objects.filter(working_group__project=project).exclude(
+            id__in=TopicMembership.objects.filter(user=user).values('topic_id')
+        ).first()
+
+        def get(url):
+            return lambda client, i: client.get(url, secure=True)
+
+        def toggle(client, i):
+            return client.post(reverse('core:toggle_participation'), {
+                'entity_type': 'topic',
+                'entity_id': free_topic.id,
+                'action': 'subscribe' if i % 2 == 0 else 'unassign',
+            }, secure=True)
+
+        def bulk(client, i):
+            operations = [{
+                'entity_type': 'topic',
+                'entity_id': free_topic.id,
+                'action': 'contribute' if i % 2 == 0 else 'unassign',
+            }]
+            return client.post(reverse('core:bulk_participation'), {'operations': operations},
+                               content_type='application/json', secure=True)
+
+        requests = {
+            'index': get(reverse('core:index')),
+            'project_list': get(reverse('core:project_list')),
+            'project_detail': get(reverse('core:project_detail', args=[project.id])),
+            'hierarchy_table': get(reverse('core:hierarchy_table')),
+            'project_participation_table': get(
+                f"{reverse('core:project_participation_table')}?project={project.id}"
+            ),
+            'users_participation_matrix': get(
+                f"{reverse('core:users_participation_matrix')}?project={project.id}"
+            ),
+            'users_participation_export': get(
+                f"{reverse('core:users_participation_export')}?project={project.id}&layout=wide"
+            ),
+            'my_participation': get(reverse('core:my_participation')),
+            # Only the WSGI stub: the stream itself is served by core.events outside Django
+            'participation_events': get(reverse('core:participation_events', args=[project.id])),
+            'api_project_list': get(reverse('core:api_project_list')),
+            'api_project_tree': get(reverse('core:api_project_tree', args=[project.id])),
+            'api_project_memberships': get(reverse('core:api_project_memberships', args=[project.id])),
+            'api_user_participation': get(reverse('core:api_user_participation', args=[user.username])),
+        }
+        if wg is not None:
+            requests['working_group_detail'] = get(reverse('core:working_group_detail', args=[wg.id]))
+        if topic is not None:
+            requests['topic_detail'] = get(reverse('core:topic_detail', args=[topic.id]))
+        if free_topic is not None:
+            requests['toggle_participation'] = toggle
+            requests['bulk_participation'] = bulk
+        return requests
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from core import dashboard, export, matrix
+from core.models import Project, WorkingGroup, Topic
+from core.participation import ParticipationIndex, leaders_queryset
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN ANALYZE on the queries issued by the core views. "
+        "Run it before and after a migration (e.g. on a dataset from seed_scale) "
+        "to compare the plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Project id (default: the one with most WGs)')
+        parser.add_argument('--user', help='Username (default: the one with most topic memberships)')
+        parser.add_argument('--view', action='append', dest='views', help='Only explain this view (repeatable)')
+        parser.add_argument('--no-analyze', action='store_true', help='Plain EXPLAIN, do not run the queries')
+
+    def handle(self, *args, **options):
+        project = self._project(options['project'])
+        user = self._user(options['user'])
+        self.stdout.write(f"Project: {project} (id={project.id}), user: {user.username} (id={user.id})")
+
+        analyze = not options['no_analyze']
+        if analyze and connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('ANALYZE needs PostgreSQL, falling back to plain EXPLAIN'))
+            analyze = False
+        explain_options = {'analyze': True, 'buffers': True} if analyze else {}
+
+        for view, label, queryset in self._queries(project, user):
+            if options['views'] and view not in options['views']:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {view}: {label}"))
+            self.stdout.write(queryset.explain(**explain_options))
+
+    def _project(self, project_id):
+        if project_id:
+            try:
+                return Project.objects.get(pk=project_id)
+            except Project.DoesNotExist:
+                raise CommandError(f"Project {project_id} does not exist")
+        project = Project.objects.annotate(wg_count=Count('working_groups')).order_by('-wg_count').first()
+        if project is None:
+            raise CommandError("No projects, seed some data first")
+        return project
+
+    def _user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"User {username} does not exist")
+        user = User.objects.annotate(n=Count('topic_memberships')).order_by('-n').first()
+        if user is None:
+            raise CommandError("No users, seed some data first")
+        return user
+
+    def _queries(self, project, user):
+        """(view name, label, queryset) for the queries each view issues"""
+        wg_ids = list(project.working_groups.values_list('id', flat=True))
+        page_user_ids = list(
+            matrix.member_users_queryset(project)[:matrix.PAGE_SIZE].values_list('id', flat=True)
+        )
+
+        queries = [
+            ('project_list', 'project index',
+             Project.objects.annotate(working_group_count=Count('working_groups')).order_by('name')),
+            ('project_detail', 'working groups of the project',
+             WorkingGroup.objects.filter(project_id__in=[project.id])),
+            ('project_detail', 'topics of the working groups',
+             Topic.objects.filter(working_group_id__in=wg_ids)),
+        ]
+        for entity_type, queryset in ParticipationIndex.querysets(user):
+            queries.append(('hierarchy_table', f'participation index ({entity_type})', queryset))
+        queries.append(('project_participation_table', 'leaders', leaders_queryset(project.id)))
+        queries += [
+            ('users_participation_matrix', 'member users page',
+             matrix.member_users_queryset(project)[:matrix.PAGE_SIZE + 1]),
+            ('users_participation_matrix', 'membership cells',
+             matrix.membership_cells_queryset(project, page_user_ids)),
+            ('users_participation_export', 'memberships of the project', export.cells_queryset(project)),
+            ('my_participation', 'memberships of the user', dashboard.memberships_queryset(user.id)),
+        ]
+        return queries
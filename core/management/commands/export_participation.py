@@ -0,0 +1,55 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import export
+from core.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the users participation matrix of a project as CSV or Parquet, "
+        "streamed from a server-side cursor so memory stays bounded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', help='Project id or name')
+        parser.add_argument('--layout', choices=export.LAYOUTS, default='long',
+                            help='long: one row per membership, wide: one row per user (default: long)')
+        parser.add_argument('--format', dest='file_format', choices=list(export.FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE,
+                            help='Rows fetched per round trip of the cursor')
+
+    def handle(self, *args, **options):
+        project = self._project(options['project'])
+        try:
+            parts = export.export(
+                project, layout=options['layout'], file_format=options['file_format'],
+                chunk_size=options['chunk_size'],
+            )
+        except export.ExportError as e:
+            raise CommandError(str(e))
+
+        binary = options['file_format'] == 'parquet'
+        if options['output']:
+            out = open(options['output'], 'wb') if binary else open(options['output'], 'w', newline='', encoding='utf-8')
+        else:
+            out = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for part in parts:
+                out.write(part)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+        if options['output']:
+            self.stderr.write(f"Exported {project} to {options['output']}")
+
+    def _project(self, value):
+        projects = Project.objects.filter(pk=value) if value.isdigit() else Project.objects.filter(name=value)
+        project = projects.first()
+        if project is None:
+            raise CommandError(f"Project {value} does not exist")
+        return project
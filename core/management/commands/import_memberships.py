@@ -0,0 +1,83 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+from core.models import WorkingGroup, Topic
+from core.participation import WORKING_GROUP, TOPIC
+
+
+class Command(BaseCommand):
+    help = (
+        "Import working group and topic memberships from a CSV or JSONL file with the fields "
+        "username, project, working_group, topic and level (an empty topic means a working "
+        "group membership). Existing memberships get the imported level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, '-' for stdin")
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension, csv for stdin)')
+        parser.add_argument('--project', help='Project name for rows without a project column')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without applying them')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Import the valid rows when some cannot be resolved')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Number of changes to list per membership table (default: 20)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        start = time.perf_counter()
+        try:
+            with (open(path, newline='', encoding='utf-8') if path != '-' else sys.stdin) as stream:
+                result = importer.import_memberships(
+                    importer.read_records(stream, file_format),
+                    default_project=options['project'],
+                    dry_run=options['dry_run'],
+                    skip_invalid=options['skip_invalid'],
+                    samples=options['show'],
+                )
+        except (OSError, importer.ImportDataError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        for line, message in result.errors[:options['show'] or None]:
+            self.stderr.write(f"line {line}: {message}")
+        if result.errors and not options['skip_invalid']:
+            raise CommandError(
+                f"{len(result.errors)} of {result.rows} rows could not be resolved, nothing imported "
+                f"(use --skip-invalid to import the others)"
+            )
+
+        self._samples(result.samples)
+        for entity_type, label in ((WORKING_GROUP, 'working group memberships'), (TOPIC, 'topic memberships')):
+            counts = result.changes[entity_type]
+            self.stdout.write(
+                f"{label}: {counts['created']} created, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged"
+            )
+        skipped = f", {len(result.errors)} skipped" if result.errors else ''
+        verb = 'checked' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(f"{result.rows} rows {verb} in {elapsed:.1f}s{skipped}"))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run, nothing was written"))
+
+    def _samples(self, samples):
+        """List the sampled changes with entity names"""
+        if not samples:
+            return
+        names = {
+            WORKING_GROUP: dict(WorkingGroup.objects.filter(
+                pk__in=[s[2] for s in samples if s[0] == WORKING_GROUP]
+            ).values_list('pk', 'name')),
+            TOPIC: {pk: f"{wg_name} / {name}" for pk, wg_name, name in Topic.objects.filter(
+                pk__in=[s[2] for s in samples if s[0] == TOPIC]
+            ).values_list('pk', 'working_group__name', 'name')},
+        }
+        for entity_type, username, entity_id, old_level, new_level in samples:
+            self.stdout.write(
+                f"  {username}: {names[entity_type].get(entity_id, entity_id)} "
+                f"{old_level or '-'} -> {new_level}"
+            )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the denormalized membership counters of working groups and topics "
+        "and repair the ones that drifted from the membership tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many counters drifted')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for entity_model in counters.ENTITY_MODELS:
+            count = counters.reconcile(entity_model, dry_run=options['dry_run'], batch_size=options['batch_size'])
+            label = entity_model._meta.verbose_name_plural
+            if options['dry_run']:
+                self.stdout.write(f"{label}: {count} drifted")
+            else:
+                self.stdout.write(f"{label}: {count} repaired")
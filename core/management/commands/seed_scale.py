@@ -0,0 +1,163 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core import counters, hierarchy
+from core.models import Project, WorkingGroup, Topic, WorkingGroupMembership, TopicMembership
+
+User = get_user_model()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic large organisation with bulk_create, e.g. "
+        "--users 50000 --projects 500 --working-groups 4000 --topics 20000 --memberships 2000000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--projects', type=int, default=20)
+        parser.add_argument('--working-groups', type=int, default=100, help='Total, spread over the projects')
+        parser.add_argument('--topics', type=int, default=1000, help='Total, spread over the working groups')
+        parser.add_argument(
+            '--memberships', type=int, default=20000,
+            help='Total memberships, 1/5 in working groups and the rest in topics'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='scale', help='Prefix of generated names')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--clear', action='store_true', help=(
+            'Delete data previously seeded with this prefix, memberships first in SQL '
+            '(an ORM cascade would load them one by one for the signals)'
+        ))
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        prefix = options['prefix']
+
+        if options['clear']:
+            self._clear(prefix)
+        elif Project.objects.filter(name__startswith=f'{prefix} ').exists():
+            raise CommandError(f"Data with prefix '{prefix}' exists, use --clear or another --prefix")
+        if min(options['users'], options['projects'], options['working_groups'], options['topics']) < 1:
+            raise CommandError("--users, --projects, --working-groups and --topics must be positive")
+
+        user_ids = self._step('users', lambda: self._users(prefix, options['users']))
+        project_ids = self._step('projects', lambda: self._projects(prefix, options['projects']))
+        wg_ids = self._step('working groups', lambda: self._working_groups(project_ids, options['working_groups']))
+        topic_ids = self._step('topics', lambda: self._topics(wg_ids, options['topics']))
+
+        wg_total = options['memberships'] // 5
+        self._step('working group memberships', lambda: self._memberships(
+            WorkingGroupMembership, 'working_group_id', wg_ids, user_ids, wg_total
+        ))
+        self._step('topic memberships', lambda: self._memberships(
+            TopicMembership, 'topic_id', topic_ids, user_ids, options['memberships'] - wg_total
+        ))
+        # bulk_create does not send the signals that invalidate the hierarchy cache,
+        # nor maintain the membership counters
+        hierarchy.bump_index()
+        for entity_model in counters.ENTITY_MODELS:
+            self._step(f'{entity_model._meta.verbose_name} counters', lambda: counters.reconcile(entity_model))
+
+    def _step(self, label, func):
+        start = time.perf_counter()
+        result = func()
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f"{label}: {count} in {time.perf_counter() - start:.1f}s")
+        return result
+
+    def _create(self, model, objects):
+        """bulk_create in batches, returning the new primary keys"""
+        ids = []
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                ids.extend(obj.pk for obj in model.objects.bulk_create(batch))
+        return ids
+
+    def _clear(self, prefix):
+        projects = Project.objects.filter(name__startswith=f'{prefix} ')
+        users = User.objects.filter(username__startswith=f'{prefix}-')
+        with transaction.atomic(), connection.cursor() as cursor:
+            # The membership post_delete receiver makes a cascade load every
+            # membership, and a user's cascade update the counters row by row:
+            # delete them with one statement per table first. The counters are
+            # reconciled after seeding.
+            for model, project_path in [
+                (WorkingGroupMembership, 'working_group__project__in'),
+                (TopicMembership, 'topic__working_group__project__in'),
+            ]:
+                memberships = model.objects.filter(Q(user__in=users) | Q(**{project_path: projects}))
+                sql, params = memberships.values('pk').query.sql_with_params()
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE {model._meta.pk.column} IN ({sql})', params)
+            # Cascades to working groups and topics
+            projects.delete()
+            users.delete()
+
+    def _users(self, prefix, count):
+        return self._create(User, (
+            User(
+                username=f'{prefix}-user-{i:07d}',
+                first_name=f'First{i}',
+                last_name=f'Last{i}',
+                email=f'{prefix}-user-{i:07d}@example.com',
+                password='!',  # unusable, users log in through Keycloak
+            )
+            for i in range(count)
+        ))
+
+    def _projects(self, prefix, count):
+        return self._create(Project, (
+            Project(name=f'{prefix} Project {i:05d}', description=f'Generated project {i}')
+            for i in range(count)
+        ))
+
+    def _working_groups(self, project_ids, count):
+        return self._create(WorkingGroup, (
+            WorkingGroup(project_id=project_ids[i % len(project_ids)], name=f'WG {i:06d}')
+            for i in range(count)
+        ))
+
+    def _topics(self, wg_ids, count):
+        return self._create(Topic, (
+            Topic(working_group_id=wg_ids[i % len(wg_ids)], name=f'Topic {i:07d}')
+            for i in range(count)
+        ))
+
+    def _memberships(self, model, field, entity_ids, user_ids, total):
+        """Spread ``total`` memberships over the entities, one leader each"""
+        per_entity, extra = divmod(total, len(entity_ids))
+        per_entity = min(per_entity, len(user_ids))
+
+        def generate():
+            for index, entity_id in enumerate(entity_ids):
+                size = min(per_entity + (1 if index < extra else 0), len(user_ids))
+                for position, user_id in enumerate(self.random.sample(user_ids, size)):
+                    if position == 0:
+                        level = 'leader'
+                    else:
+                        level = 'contributor' if self.random.random() < 0.3 else 'subscriber'
+                    yield model(user_id=user_id, participation_level=level, **{field: entity_id})
+
+        count = 0
+        for batch in batched(generate(), self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
@@ -0,0 +1,156 @@
+# core/matrix.py
+from itertools import groupby
+from operator import itemgetter
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Prefetch
+
+from .models import ParticipationFact, Topic
+from .participation import WORKING_GROUP, TOPIC
+
+User = get_user_model()
+
+# Map participation_level to single-letter
+LEVEL_LETTERS = {
+    'leader': 'L',
+    'contributor': 'C',
+    'subscriber': 'S'
+}
+
+# Column type of each membership type
+COLUMN_TYPES = {WORKING_GROUP: 'wg', TOPIC: 'topic'}
+
+# Users per page and users rendered per streamed chunk
+PAGE_SIZE = 100
+CHUNK_SIZE = 25
+
+
+def columns_queryset(project):
+    """The project's working groups, ordered by name, with their topics prefetched"""
+    return project.working_groups.prefetch_related(
+        Prefetch('topics', queryset=Topic.objects.order_by('name'))
+    ).order_by('name')
+
+
+def columns_for(working_groups):
+    """Build ordered columns from working groups with prefetched topics"""
+    columns = []
+    for wg_index, wg in enumerate(working_groups, 1):
+        columns.append({'type': 'wg', 'id': wg.id, 'name': wg.name, 'wg_index': wg_index})
+        for topic_index, topic in enumerate(wg.topics.all(), 1):
+            columns.append({
+                'type': 'topic',
+                'id': topic.id,
+                'name': f"{wg.name} / {topic.name}",
+                'wg_index': wg_index,
+                'topic_index': topic_index
+            })
+    return columns
+
+
+def build_columns(project):
+    """
+    Build ordered columns for a project: first each WG, then its topics.
+    Runs two queries (working groups, then their topics) regardless of size.
+    """
+    return columns_for(columns_queryset(project))
+
+
+async def abuild_columns(project):
+    """Async version of build_columns"""
+    return columns_for([wg async for wg in columns_queryset(project)])
+
+
+def member_users_queryset(project, after=None, search=None):
+    """Users having at least one membership in the project, ordered by username"""
+    users = User.objects.filter(Exists(ParticipationFact.objects.filter(user=OuterRef('pk'), project=project)))
+    if search:
+        users = users.filter(username__icontains=search)
+    if after:
+        users = users.filter(username__gt=after)
+    return users.order_by('username').only('id', 'username', 'first_name', 'last_name')
+
+
+def _page(users, limit):
+    if len(users) > limit:
+        users = users[:limit]
+        return users, users[-1].username
+    return users, None
+
+
+def member_users(project, after=None, search=None, limit=PAGE_SIZE):
+    """
+    Return one page of users having at least one membership in the project,
+    ordered by username (keyset pagination on ``after``).
+    Returns (users, next_after) where next_after is None on the last page.
+    """
+    return _page(list(member_users_queryset(project, after=after, search=search)[:limit + 1]), limit)
+
+
+async def amember_users(project, after=None, search=None, limit=PAGE_SIZE):
+    """Async version of member_users"""
+    queryset = member_users_queryset(project, after=after, search=search)[:limit + 1]
+    return _page([user async for user in queryset], limit)
+
+
+def membership_cells_queryset(project, user_ids):
+    """
+    The users' memberships in the project, read from the participation facts
+    (core_fact_project_user_cover_idx, index-only) and ordered by user.
+    """
+    return ParticipationFact.objects.filter(project=project, user_id__in=user_ids).order_by(
+        'user_id'
+    ).values_list('user_id', 'membership_type', 'entity_id', 'participation_level')
+
+
+def membership_cells(project, user_ids):
+    """
+    Fetch the users' memberships in the project.
+    Returns (user_id, column_type, entity_id, level) tuples grouped by user.
+    """
+    cells = membership_cells_queryset(project, user_ids)
+    return [
+        (user_id, COLUMN_TYPES[membership_type], entity_id, level)
+        for user_id, membership_type, entity_id, level in cells
+    ]
+
+
+async def amembership_cells(project, user_ids):
+    """Async version of membership_cells"""
+    cells = membership_cells_queryset(project, user_ids)
+    return [
+        (user_id, COLUMN_TYPES[membership_type], entity_id, level)
+        async for user_id, membership_type, entity_id, level in cells
+    ]
+
+
+def iter_rows(users, columns, cells):
+    """Yield {'user', 'statuses'} rows lazily, one user at a time"""
+    positions = {(col['type'], col['id']): index for index, col in enumerate(columns)}
+    statuses_by_user = {}
+    for user_id, user_cells in groupby(cells, key=itemgetter(0)):
+        statuses = [''] * len(columns)
+        for _, column_type, entity_id, level in user_cells:
+            # Skip entities created after the columns were read
+            index = positions.get((column_type, entity_id))
+            if index is not None:
+                statuses[index] = LEVEL_LETTERS.get(level, '')
+        statuses_by_user[user_id] = statuses
+
+    for user in users:
+        yield {
+            'user': user,
+            'statuses': statuses_by_user.get(user.id) or [''] * len(columns)
+        }
+
+
+def iter_chunks(rows, size=CHUNK_SIZE):
+    """Group an iterable of rows into lists of at most ``size`` rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
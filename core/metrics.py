@@ -0,0 +1,87 @@
+# core/metrics.py
+"""
+Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py)
+every worker writes its samples to that directory and the /metrics view
+aggregates them across workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'faberorg_request_duration_seconds',
+    'Request latency by URL name',
+    ['view', 'method', 'status'],
+)
+DB_QUERIES = Histogram(
+    'faberorg_request_db_queries',
+    'Database queries per request by URL name (sampled requests only)',
+    ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+DB_TIME = Histogram(
+    'faberorg_request_db_duration_seconds',
+    'SQL time per request by URL name (sampled requests only)',
+    ['view'],
+)
+CACHE_REQUESTS = Counter(
+    'faberorg_cache_requests_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+OIDC_LATENCY = Histogram(
+    'faberorg_oidc_duration_seconds',
+    'KeycloakOIDCBackend timings by operation',
+    ['operation'],
+)
+
+DB_POOL = Gauge(
+    'faberorg_db_pool',
+    'psycopg_pool statistics by database alias, summed over the live workers',
+    ['alias', 'stat'],
+    multiprocess_mode='livesum',
+)
+
+
+def record_cache(cache, hits=0, misses=0):
+    """Count cache hits and misses, e.g. record_cache('hierarchy', hits=3)"""
+    if hits:
+        CACHE_REQUESTS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(cache, 'miss').inc(misses)
+
+
+@contextmanager
+def time_oidc(operation):
+    """Time a block of the OIDC backend, e.g. ``with time_oidc('authenticate'):``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        OIDC_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+
+def record_db_pools():
+    """Copy the statistics of this process' connection pools into DB_POOL"""
+    # Pools are shared by the threads of the process, so this also works from
+    # the event loop thread under ASGI
+    for connection in connections.all():
+        if not connection.settings_dict.get('OPTIONS', {}).get('pool'):
+            continue
+        for stat, value in connection.pool.get_stats().items():
+            DB_POOL.labels(connection.alias, stat).set(value)
+
+
+def render_latest():
+    """Return (body, content_type) of the current metrics, aggregated across workers"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
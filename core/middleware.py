@@ -0,0 +1,333 @@
+# core/middleware.py
+import logging
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryStats:
+    """Execute wrapper counting the queries, SQL time and repeated statements of a request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        """Executions of a statement beyond its first one (N+1 patterns)"""
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def most_repeated(self):
+        """Return (sql, count) of the most repeated statement, or None"""
+        if not self.statements:
+            return None
+        sql, n = self.statements.most_common(1)[0]
+        return (sql, n) if n > 1 else None
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Count queries, SQL time and duplicate statements per request through
+    ``connection.execute_wrapper``, and report them as a ``Server-Timing``
+    header and a log line on the ``core.queries`` logger. Requests above the
+    QUERY_*_THRESHOLD settings are logged as warnings.
+
+    Only a QUERY_INSTRUMENTATION_SAMPLE_RATE fraction of requests is wrapped.
+    Queries run while a streaming response is consumed are not counted.
+    Under ASGI the wrappers are installed on the connections of the thread
+    that runs the request's ORM calls.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'QUERY_INSTRUMENTATION_SAMPLE_RATE', 1.0)
+        self.server_timing = getattr(settings, 'QUERY_SERVER_TIMING', True)
+        self.max_queries = getattr(settings, 'QUERY_COUNT_THRESHOLD', 50)
+        self.max_sql_ms = getattr(settings, 'QUERY_TIME_THRESHOLD_MS', 200)
+        self.max_duplicates = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', 10)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        stats = QueryStats()
+        request.query_stats = stats
+        start = time.perf_counter()
+        with self._wrap(stats):
+            response = self.get_response(request)
+        return self._report(request, response, stats, start)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        request.query_stats = stats
+        start = time.perf_counter()
+        # Thread-sensitive sync_to_async calls of one request share a thread
+        wrappers = await sync_to_async(self._wrap)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+        return self._report(request, response, stats, start)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _wrap(self, stats):
+        """Install ``stats`` on every connection of the current thread"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        return stack
+
+    def _report(self, request, response, stats, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = stats.duration * 1000
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'sql;dur={sql_ms:.1f};desc="{stats.count} queries, {stats.duplicates} duplicates", '
+                f'app;dur={total_ms:.1f}'
+            )
+        self._log(request, response, stats, sql_ms, total_ms)
+        return response
+
+    def _log(self, request, response, stats, sql_ms, total_ms):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+        flags = []
+        if stats.count > self.max_queries:
+            flags.append('query_count')
+        if sql_ms > self.max_sql_ms:
+            flags.append('sql_time')
+        if stats.duplicates > self.max_duplicates:
+            flags.append('duplicates')
+
+        level = logging.WARNING if flags else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        repeated = stats.most_repeated() if 'duplicates' in flags else None
+        logger.log(
+            level,
+            "%s %s view=%s status=%s queries=%d duplicates=%d sql_ms=%.1f total_ms=%.1f%s",
+            request.method, request.path, view, response.status_code,
+            stats.count, stats.duplicates, sql_ms, total_ms,
+            f" flags={','.join(flags)}" if flags else '',
+            extra={
+                'view': view,
+                'status': response.status_code,
+                'queries': stats.count,
+                'duplicates': stats.duplicates,
+                'sql_ms': round(sql_ms, 1),
+                'total_ms': round(total_ms, 1),
+                'flags': flags,
+                'most_repeated_sql': repeated[0] if repeated else None,
+            },
+        )
+
+
+class MetricsMiddleware:
+    """
+    Record request latency per URL name, plus the query count and SQL time
+    measured by QueryInstrumentationMiddleware when the request was sampled,
+    and refresh the connection pool statistics.
+    Must come before QueryInstrumentationMiddleware in MIDDLEWARE.
+    """
+
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        method = request.method if request.method in self.METHODS else 'other'
+        metrics.REQUEST_LATENCY.labels(view, method, response.status_code).observe(duration)
+
+        stats = getattr(request, 'query_stats', None)
+        if stats is not None:
+            metrics.DB_QUERIES.labels(view).observe(stats.count)
+            metrics.DB_TIME.labels(view).observe(stats.duration)
+        metrics.record_db_pools()
+
+
+class GzipEncoder:
+    """Incremental gzip stream, flushed after every chunk"""
+
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    """Incremental brotli stream, flushed after every chunk"""
+
+    encoding = 'br'
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress HTML, JSON and CSV responses with brotli or gzip, whichever the
+    client accepts (brotli first). Responses shorter than
+    COMPRESSION_MIN_SIZE bytes are sent as they are. Streaming responses are
+    compressed chunk by chunk and flushed after each chunk, so a streamed
+    page still reaches the browser as it is rendered. Event streams are
+    never compressed.
+
+    Static files are served precompressed by WhiteNoise, which comes before
+    this middleware. CSRF tokens are masked per response, so compressing the
+    pages that embed them does not expose them to BREACH.
+    """
+
+    CONTENT_TYPES = {'text/html', 'application/json', 'text/csv'}
+    ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+    ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    def _encoder(self, request):
+        accept = request.headers.get('Accept-Encoding', '')
+        if brotli is not None and self.ACCEPTS_BROTLI.search(accept):
+            return BrotliEncoder(self.brotli_quality)
+        if self.ACCEPTS_GZIP.search(accept):
+            return GzipEncoder(self.gzip_level)
+        return None
+
+    def _compress(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in self.CONTENT_TYPES or response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        # The response depends on Accept-Encoding from here on, even when not compressed
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder = self._encoder(request)
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._acompress(encoder, response.streaming_content)
+            else:
+                response.streaming_content = self._compress_stream(encoder, response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = encoder.compress(response.content) + encoder.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The compressed body differs byte for byte from the one the ETag was computed on
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.encoding
+        return response
+
+    @staticmethod
+    def _compress_stream(encoder, chunks):
+        for chunk in chunks:
+            if chunk:
+                yield encoder.compress(chunk)
+        yield encoder.finish()
+
+    @staticmethod
+    async def _acompress(encoder, chunks):
+        async for chunk in chunks:
+            if chunk:
+                yield encoder.compress(chunk)
+        yield encoder.finish()
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='topicmembership',
+            index=models.Index(condition=models.Q(('participation_level', 'leader')), fields=['topic'], name='core_tm_leader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topicmembership',
+            index=models.Index(fields=['topic', 'participation_level'], name='core_tm_topic_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topicmembership',
+            index=models.Index(fields=['user', 'topic'], include=('participation_level',), name='core_tm_user_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workinggroupmembership',
+            index=models.Index(condition=models.Q(('participation_level', 'leader')), fields=['working_group'], name='core_wgm_leader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workinggroupmembership',
+            index=models.Index(fields=['working_group', 'participation_level'], name='core_wgm_wg_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workinggroupmembership',
+            index=models.Index(fields=['user', 'working_group'], include=('participation_level',), name='core_wgm_user_cover_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    """Count the existing memberships, one UPDATE per entity table and level"""
+    for entity_name, membership_name, field in [
+        ('WorkingGroup', 'WorkingGroupMembership', 'working_group'),
+        ('Topic', 'TopicMembership', 'topic'),
+    ]:
+        entity_model = apps.get_model('core', entity_name)
+        membership_model = apps.get_model('core', membership_name)
+        for level in ('subscriber', 'contributor', 'leader'):
+            count = membership_model.objects.filter(
+                **{field: OuterRef('pk')}, participation_level=level
+            ).order_by().values(field).annotate(n=Count('pk')).values('n')
+            entity_model.objects.update(**{f'{level}_count': Coalesce(Subquery(count), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_membership_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='contributor_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='leader_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workinggroup',
+            name='contributor_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workinggroup',
+            name='leader_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workinggroup',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
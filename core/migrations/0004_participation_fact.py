@@ -0,0 +1,216 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import NotSupportedError, migrations, models
+
+
+# One row per membership with the project it belongs to
+FACTS_SELECT = """
+SELECT 'working_group' AS membership_type, m.id AS membership_id, m.user_id, wg.project_id,
+       m.working_group_id, NULL AS topic_id, m.working_group_id AS entity_id, m.participation_level
+FROM core_workinggroupmembership m
+JOIN core_workinggroup wg ON wg.id = m.working_group_id
+UNION ALL
+SELECT 'topic', m.id, m.user_id, wg.project_id,
+       t.working_group_id, m.topic_id, m.topic_id, m.participation_level
+FROM core_topicmembership m
+JOIN core_topic t ON t.id = m.topic_id
+JOIN core_workinggroup wg ON wg.id = t.working_group_id
+"""
+
+FACTS_COLUMNS = (
+    'membership_type, membership_id, user_id, project_id, working_group_id, topic_id, '
+    'entity_id, participation_level'
+)
+
+# The facts are a table, filled from the membership tables and
+# kept in sync by statement-level triggers (set based, so bulk writes and
+# imports update it in one statement), plus row-level triggers for the rare
+# moves of a topic or working group. TRUNCATE of a membership table clears
+# its facts.
+POSTGRES_FORWARD = f"""
+CREATE TABLE core_participation_fact (
+    membership_type varchar(20) NOT NULL,
+    membership_id bigint NOT NULL,
+    user_id integer NOT NULL,
+    project_id bigint NOT NULL,
+    working_group_id bigint NOT NULL,
+    topic_id bigint NULL,
+    entity_id bigint NOT NULL,
+    participation_level varchar(20) NOT NULL,
+    PRIMARY KEY (membership_type, membership_id)
+);
+
+INSERT INTO core_participation_fact ({FACTS_COLUMNS}) {FACTS_SELECT};
+
+-- Matrix rows and cells of a project, index-only
+CREATE INDEX core_fact_project_user_idx ON core_participation_fact (project_id, user_id)
+    INCLUDE (membership_type, entity_id, participation_level);
+-- Leaders of a project
+CREATE INDEX core_fact_project_leader_idx ON core_participation_fact (project_id)
+    WHERE participation_level = 'leader';
+-- Memberships of a user across projects
+CREATE INDEX core_fact_user_idx ON core_participation_fact (user_id, project_id);
+-- Moves of working groups and topics
+CREATE INDEX core_fact_wg_idx ON core_participation_fact (working_group_id);
+CREATE INDEX core_fact_topic_idx ON core_participation_fact (topic_id) WHERE topic_id IS NOT NULL;
+
+CREATE FUNCTION core_fact_wgm_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO core_participation_fact ({FACTS_COLUMNS})
+    SELECT 'working_group', n.id, n.user_id, wg.project_id, n.working_group_id, NULL, n.working_group_id,
+           n.participation_level
+    FROM new_rows n JOIN core_workinggroup wg ON wg.id = n.working_group_id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_wgm_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_participation_fact f
+    SET user_id = n.user_id, project_id = wg.project_id, working_group_id = n.working_group_id,
+        entity_id = n.working_group_id, participation_level = n.participation_level
+    FROM new_rows n JOIN core_workinggroup wg ON wg.id = n.working_group_id
+    WHERE f.membership_type = 'working_group' AND f.membership_id = n.id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_tm_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO core_participation_fact ({FACTS_COLUMNS})
+    SELECT 'topic', n.id, n.user_id, wg.project_id, t.working_group_id, n.topic_id, n.topic_id,
+           n.participation_level
+    FROM new_rows n
+    JOIN core_topic t ON t.id = n.topic_id
+    JOIN core_workinggroup wg ON wg.id = t.working_group_id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_tm_update() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_participation_fact f
+    SET user_id = n.user_id, project_id = wg.project_id, working_group_id = t.working_group_id,
+        topic_id = n.topic_id, entity_id = n.topic_id, participation_level = n.participation_level
+    FROM new_rows n
+    JOIN core_topic t ON t.id = n.topic_id
+    JOIN core_workinggroup wg ON wg.id = t.working_group_id
+    WHERE f.membership_type = 'topic' AND f.membership_id = n.id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM core_participation_fact f USING old_rows o
+    WHERE f.membership_type = TG_ARGV[0] AND f.membership_id = o.id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM core_participation_fact WHERE membership_type = TG_ARGV[0];
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_topic_moved() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_participation_fact
+    SET working_group_id = NEW.working_group_id,
+        project_id = (SELECT project_id FROM core_workinggroup WHERE id = NEW.working_group_id)
+    WHERE topic_id = NEW.id;
+    RETURN NULL;
+END $$;
+
+CREATE FUNCTION core_fact_wg_moved() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE core_participation_fact SET project_id = NEW.project_id WHERE working_group_id = NEW.id;
+    RETURN NULL;
+END $$;
+
+CREATE TRIGGER core_fact_wgm_insert AFTER INSERT ON core_workinggroupmembership
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_wgm_insert();
+CREATE TRIGGER core_fact_wgm_update AFTER UPDATE ON core_workinggroupmembership
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_wgm_update();
+CREATE TRIGGER core_fact_wgm_delete AFTER DELETE ON core_workinggroupmembership
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_delete('working_group');
+CREATE TRIGGER core_fact_wgm_truncate AFTER TRUNCATE ON core_workinggroupmembership
+    FOR EACH STATEMENT EXECUTE FUNCTION core_fact_truncate('working_group');
+
+CREATE TRIGGER core_fact_tm_insert AFTER INSERT ON core_topicmembership
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_tm_insert();
+CREATE TRIGGER core_fact_tm_update AFTER UPDATE ON core_topicmembership
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_tm_update();
+CREATE TRIGGER core_fact_tm_delete AFTER DELETE ON core_topicmembership
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_delete('topic');
+CREATE TRIGGER core_fact_tm_truncate AFTER TRUNCATE ON core_topicmembership
+    FOR EACH STATEMENT EXECUTE FUNCTION core_fact_truncate('topic');
+
+CREATE TRIGGER core_fact_topic_moved AFTER UPDATE OF working_group_id ON core_topic
+    FOR EACH ROW WHEN (OLD.working_group_id IS DISTINCT FROM NEW.working_group_id)
+    EXECUTE FUNCTION core_fact_topic_moved();
+CREATE TRIGGER core_fact_wg_moved AFTER UPDATE OF project_id ON core_workinggroup
+    FOR EACH ROW WHEN (OLD.project_id IS DISTINCT FROM NEW.project_id)
+    EXECUTE FUNCTION core_fact_wg_moved();
+"""
+
+POSTGRES_REVERSE = """
+DROP TRIGGER core_fact_wg_moved ON core_workinggroup;
+DROP TRIGGER core_fact_topic_moved ON core_topic;
+DROP TRIGGER core_fact_tm_truncate ON core_topicmembership;
+DROP TRIGGER core_fact_tm_delete ON core_topicmembership;
+DROP TRIGGER core_fact_tm_update ON core_topicmembership;
+DROP TRIGGER core_fact_tm_insert ON core_topicmembership;
+DROP TRIGGER core_fact_wgm_truncate ON core_workinggroupmembership;
+DROP TRIGGER core_fact_wgm_delete ON core_workinggroupmembership;
+DROP TRIGGER core_fact_wgm_update ON core_workinggroupmembership;
+DROP TRIGGER core_fact_wgm_insert ON core_workinggroupmembership;
+DROP FUNCTION core_fact_wg_moved();
+DROP FUNCTION core_fact_topic_moved();
+DROP FUNCTION core_fact_truncate();
+DROP FUNCTION core_fact_delete();
+DROP FUNCTION core_fact_tm_update();
+DROP FUNCTION core_fact_tm_insert();
+DROP FUNCTION core_fact_wgm_update();
+DROP FUNCTION core_fact_wgm_insert();
+DROP TABLE core_participation_fact;
+"""
+
+
+def create_facts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        raise NotSupportedError('The participation facts are kept in sync by PostgreSQL triggers')
+    # No params: psycopg only runs several statements in one call without them
+    schema_editor.execute(POSTGRES_FORWARD, params=None)
+
+
+def drop_facts(apps, schema_editor):
+    schema_editor.execute(POSTGRES_REVERSE, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_membership_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipationFact',
+            fields=[
+                ('pk', models.CompositePrimaryKey('membership_type', 'membership_id', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('membership_type', models.CharField(max_length=20)),
+                ('membership_id', models.BigIntegerField()),
+                ('entity_id', models.BigIntegerField()),
+                ('participation_level', models.CharField(choices=[('subscriber', 'Subscriber'), ('contributor', 'Contributor'), ('leader', 'Leader')], max_length=20)),
+                ('project', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.project')),
+                ('topic', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.topic')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('working_group', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.workinggroup')),
+            ],
+            options={
+                'db_table': 'core_participation_fact',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_facts, drop_facts),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:55
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import migrations
+
+
+# NOTIFY participation with the changes of each project written by a
+# statement (see core/events.py). Statements changing more than
+# NOTIFY_MAX_CHANGES memberships of a project (imports, cascades) send
+# {"project": id, "reload": true} instead, keeping payloads under the 8000
+# byte limit of NOTIFY.
+NOTIFY_MAX_CHANGES = 20
+
+
+def notify_function(name, changes_sql, username_sql):
+    """
+    A trigger function sending one notification per project. ``changes_sql``
+    selects project_id, membership_type, entity_id, user_id, old_level and
+    new_level; only the changes that are sent are turned into JSON.
+    ``username_sql`` selects the username of ``numbered.user_id``.
+    """
+    return f"""
+CREATE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('participation', CASE
+        WHEN COUNT(*) > {NOTIFY_MAX_CHANGES}
+        THEN json_build_object('project', project_id, 'reload', true)
+        ELSE json_build_object('project', project_id, 'changes', json_agg(json_build_object(
+            'type', membership_type, 'id', entity_id,
+            'user', ({username_sql}),
+            'old', old_level, 'level', new_level
+        )) FILTER (WHERE rn <= {NOTIFY_MAX_CHANGES}))
+    END::text)
+    FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY project_id) AS rn FROM ({changes_sql}) changes
+    ) numbered
+    GROUP BY project_id;
+    RETURN NULL;
+END $$;
+"""
+
+
+POSTGRES_TRIGGERS = """
+CREATE TRIGGER core_fact_notify_insert AFTER INSERT ON core_participation_fact
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_notify_insert();
+CREATE TRIGGER core_fact_notify_update AFTER UPDATE ON core_participation_fact
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION core_fact_notify_update();
+CREATE TRIGGER core_fact_notify_delete AFTER DELETE ON core_participation_fact
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION core_fact_notify_delete();
+"""
+
+
+def postgres_forward(username_sql):
+    return (
+        notify_function('core_fact_notify_insert', (
+            'SELECT project_id, membership_type, entity_id, user_id, '
+            'NULL::varchar AS old_level, participation_level AS new_level FROM new_rows'
+        ), username_sql)
+        + notify_function('core_fact_notify_update', (
+            'SELECT n.project_id, n.membership_type, n.entity_id, n.user_id, '
+            'o.participation_level AS old_level, n.participation_level AS new_level '
+            'FROM old_rows o JOIN new_rows n USING (membership_type, membership_id) '
+            'WHERE o.participation_level IS DISTINCT FROM n.participation_level'
+        ), username_sql)
+        + notify_function('core_fact_notify_delete', (
+            'SELECT project_id, membership_type, entity_id, user_id, '
+            'participation_level AS old_level, NULL::varchar AS new_level FROM old_rows'
+        ), username_sql)
+        + POSTGRES_TRIGGERS
+    )
+
+
+POSTGRES_REVERSE = """
+DROP TRIGGER core_fact_notify_delete ON core_participation_fact;
+DROP TRIGGER core_fact_notify_update ON core_participation_fact;
+DROP TRIGGER core_fact_notify_insert ON core_participation_fact;
+DROP FUNCTION core_fact_notify_delete();
+DROP FUNCTION core_fact_notify_update();
+DROP FUNCTION core_fact_notify_insert();
+"""
+
+
+def username_sql(apps, schema_editor):
+    """The subquery selecting the username of a change from the AUTH_USER_MODEL table"""
+    meta = apps.get_model(settings.AUTH_USER_MODEL)._meta
+    # Historical models lack USERNAME_FIELD
+    username = meta.get_field(get_user_model().USERNAME_FIELD).column
+    quote = schema_editor.quote_name
+    return f'SELECT {quote(username)} FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} = numbered.user_id'
+
+
+def create_notify(apps, schema_editor):
+    # Other databases have no NOTIFY; the events stream only sends keepalives
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(postgres_forward(username_sql(apps, schema_editor)), params=None)
+
+
+def drop_notify(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_REVERSE, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0004_participation_fact'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_notify, drop_notify),
+    ]
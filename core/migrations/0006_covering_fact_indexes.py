@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:10
+
+from django.db import migrations
+
+
+# Index-only reads of the participation facts: the export scans a project's
+# facts for their working group and topic too, and the participation table
+# reads leaders sorted by entity. Built and dropped concurrently, so the
+# membership triggers keep writing to the table meanwhile.
+FORWARD = [
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS core_fact_project_user_cover_idx '
+    'ON core_participation_fact (project_id, user_id) '
+    'INCLUDE (membership_type, entity_id, participation_level, working_group_id, topic_id)',
+    'DROP INDEX CONCURRENTLY IF EXISTS core_fact_project_user_idx',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS core_fact_project_leader_cover_idx '
+    'ON core_participation_fact (project_id, membership_type, entity_id, user_id) '
+    "INCLUDE (membership_id, participation_level) WHERE participation_level = 'leader'",
+    'DROP INDEX CONCURRENTLY IF EXISTS core_fact_project_leader_idx',
+]
+
+REVERSE = [
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS core_fact_project_leader_idx '
+    "ON core_participation_fact (project_id) WHERE participation_level = 'leader'",
+    'DROP INDEX CONCURRENTLY IF EXISTS core_fact_project_leader_cover_idx',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS core_fact_project_user_idx '
+    'ON core_participation_fact (project_id, user_id) '
+    'INCLUDE (membership_type, entity_id, participation_level)',
+    'DROP INDEX CONCURRENTLY IF EXISTS core_fact_project_user_cover_idx',
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        # Elsewhere the facts are a view (see 0004)
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_participation_notify'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(REVERSE)),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -12,6 +13,40 @@ class BaseModel(models.Model):
         abstract = True
 
 
+# Membership counter fields of WorkingGroup and Topic, by participation_level
+COUNTER_FIELDS = {
+    'subscriber': 'subscriber_count',
+    'contributor': 'contributor_count',
+    'leader': 'leader_count',
+}
+
+
+class MembershipCounts(models.Model):
+    """
+    Abstract model with denormalized membership counters. They are only ever
+    changed in the database (see core/counters.py), so saving an existing
+    instance does not write them back.
+    """
+    subscriber_count = models.PositiveIntegerField(default=0, editable=False)
+    contributor_count = models.PositiveIntegerField(default=0, editable=False)
+    leader_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def member_count(self):
+        return self.subscriber_count + self.contributor_count + self.leader_count
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS.values()
+            ]
+        super().save(*args, **kwargs)
+
+
 class Project(BaseModel):
     """Represents a project in the Faber ecosystem"""
     name = models.CharField(max_length=100, unique=True)
@@ -25,7 +60,7 @@ class Project(BaseModel):
         return self.name
 
 
-class WorkingGroup(BaseModel):
+class WorkingGroup(MembershipCounts, BaseModel):
     """Represents a working group within a project"""
     project = models.ForeignKey(
         Project,
@@ -43,7 +78,7 @@ class WorkingGroup(BaseModel):
         return f"{self.project.name} - {self.name}"
 
 
-class Topic(BaseModel):
+class Topic(MembershipCounts, BaseModel):
     """Represents a topic/subtopic within a working group"""
     working_group = models.ForeignKey(
         WorkingGroup,
@@ -92,6 +127,21 @@ class WorkingGroupMembership(BaseModel):
         unique_together = ['user', 'working_group']
         # unique_together = ['keycloak_user_id', 'working_group']
         ordering = ['working_group', 'user']
+        indexes = [
+            # Leader lookup per working group
+            models.Index(
+                fields=['working_group'],
+                condition=Q(participation_level='leader'),
+                name='core_wgm_leader_idx',
+            ),
+            models.Index(fields=['working_group', 'participation_level'], name='core_wgm_wg_level_idx'),
+            # Lets per-user lookups (participation index, matrix cells) run index-only
+            models.Index(
+                fields=['user', 'working_group'],
+                include=['participation_level'],
+                name='core_wgm_user_cover_idx',
+            ),
+        ]
 
     @property
     def is_leader(self):
@@ -140,6 +190,21 @@ class TopicMembership(BaseModel):
         unique_together = ['user', 'topic']
         # unique_together = ['keycloak_user_id', 'topic']
         ordering = ['topic', 'user']
+        indexes = [
+            # Leader lookup per topic
+            models.Index(
+                fields=['topic'],
+                condition=Q(participation_level='leader'),
+                name='core_tm_leader_idx',
+            ),
+            models.Index(fields=['topic', 'participation_level'], name='core_tm_topic_level_idx'),
+            # Lets per-user lookups (participation index, matrix cells) run index-only
+            models.Index(
+                fields=['user', 'topic'],
+                include=['participation_level'],
+                name='core_tm_user_cover_idx',
+            ),
+        ]
 
     @property
     def is_leader(self):
@@ -155,3 +220,34 @@ class TopicMembership(BaseModel):
 
     def __str__(self):
         return f"{self.user_display_name} - {self.topic} ({self.get_participation_level_display()})"
+
+
+class ParticipationFact(models.Model):
+    """
+    Read-only flat copy of the working group and topic memberships with their
+    project, maintained by the database (see migration 0004): a table kept up
+    to date by triggers on PostgreSQL, a plain view elsewhere.
+    """
+    pk = models.CompositePrimaryKey('membership_type', 'membership_id')
+    # 'working_group' or 'topic', the membership table the row comes from
+    membership_type = models.CharField(max_length=20)
+    membership_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    working_group = models.ForeignKey(
+        WorkingGroup, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    # Null for working group memberships
+    topic = models.ForeignKey(
+        Topic, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    # working_group_id or topic_id, depending on membership_type
+    entity_id = models.BigIntegerField()
+    participation_level = models.CharField(max_length=20, choices=WorkingGroupMembership.PARTICIPATION_CHOICES)
+
+    class Meta:
+        managed = False
+        db_table = 'core_participation_fact'
+
+    def __str__(self):
+        return f"{self.membership_type} {self.entity_id}: user {self.user_id} ({self.participation_level})"
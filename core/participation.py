@@ -0,0 +1,314 @@
+# core/participation.py
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import dashboard
+from .counters import Deltas, update_counts_sql
+from .models import ParticipationFact, WorkingGroup, Topic, WorkingGroupMembership, TopicMembership
+
+# Entity types, as posted to toggle_participation
+WORKING_GROUP = 'working_group'
+TOPIC = 'topic'
+
+LEVEL_DISPLAY = dict(WorkingGroupMembership.PARTICIPATION_CHOICES)
+
+
+class ParticipationIndex:
+    """
+    A user's WG and topic memberships, loaded once and keyed by
+    (entity_type, id) -> participation_level.
+    """
+
+    def __init__(self, levels=None):
+        self.levels = levels or {}
+
+    @staticmethod
+    def querysets(user):
+        """The (entity_type, queryset) pairs loaded by for_user"""
+        return [
+            (WORKING_GROUP, WorkingGroupMembership.objects.filter(user=user).order_by().values_list(
+                'working_group_id', 'participation_level'
+            )),
+            (TOPIC, TopicMembership.objects.filter(user=user).order_by().values_list(
+                'topic_id', 'participation_level'
+            )),
+        ]
+
+    @classmethod
+    def for_user(cls, user):
+        """Load all memberships of the user with one query per membership table"""
+        levels = {}
+        if user is None or not user.is_authenticated:
+            return cls(levels)
+
+        for entity_type, queryset in cls.querysets(user):
+            for entity_id, level in queryset:
+                levels[(entity_type, entity_id)] = level
+        return cls(levels)
+
+    @classmethod
+    async def afor_user(cls, user):
+        """Async version of for_user"""
+        levels = {}
+        if user is None or not user.is_authenticated:
+            return cls(levels)
+
+        for entity_type, queryset in cls.querysets(user):
+            async for entity_id, level in queryset:
+                levels[(entity_type, entity_id)] = level
+        return cls(levels)
+
+    def level(self, entity_type, entity_id):
+        """Return the participation level or None if not a member"""
+        return self.levels.get((entity_type, entity_id))
+
+    def level_display(self, entity_type, entity_id):
+        """Return the human readable participation level or None if not a member"""
+        return LEVEL_DISPLAY.get(self.level(entity_type, entity_id))
+
+
+def get_participation_index(request):
+    """Return the participation index of the request's user, built once per request"""
+    index = getattr(request, '_participation_index', None)
+    if index is None:
+        index = ParticipationIndex.for_user(getattr(request, 'user', None))
+        request._participation_index = index
+    return index
+
+
+async def aget_participation_index(request):
+    """Async version of get_participation_index"""
+    index = getattr(request, '_participation_index', None)
+    if index is None:
+        index = await ParticipationIndex.afor_user(await request.auser())
+        request._participation_index = index
+    return index
+
+
+def leaders_queryset(project_id):
+    """
+    The leader memberships of a project's working groups and topics, with
+    the leaders' usernames joined in, read from the participation facts
+    (core_fact_project_leader_cover_idx) in a single query.
+    """
+    return ParticipationFact.objects.filter(
+        project_id=project_id, participation_level='leader'
+    ).select_related('user').only(
+        'membership_type', 'membership_id', 'entity_id', 'participation_level', 'user__username'
+    ).order_by('membership_type', 'entity_id', 'user_id')
+
+
+def get_leaders(project_id):
+    """Return {(entity_type, entity_id): leader membership fact} for a project"""
+    leaders = {}
+    for fact in leaders_queryset(project_id):
+        leaders.setdefault((fact.membership_type, fact.entity_id), fact)
+    return leaders
+
+
+ACTION_LEVELS = {
+    'subscribe': 'subscriber',
+    'contribute': 'contributor',
+    'unassign': None,
+}
+
+# entity_type -> (membership model, entity model, FK field name)
+MEMBERSHIP_TABLES = {
+    WORKING_GROUP: (WorkingGroupMembership, WorkingGroup, 'working_group'),
+    TOPIC: (TopicMembership, Topic, 'topic'),
+}
+
+LEADER_ERROR = 'Leaders cannot modify their own participation'
+
+
+def apply_operations(user, operations):
+    """
+    Apply a batch of participation changes for ``user`` in one transaction.
+
+    ``operations`` is a list of {'entity_type', 'entity_id', 'action'} dicts,
+    with integer entity ids.
+    Memberships to create or change are written with a single upsert per
+    membership table and removals with a single DELETE per table. Returns one
+    result dict per operation, in order; only the first operation on a given
+    entity is applied.
+    """
+    results = []
+    # entity_type -> {entity_id: index of the operation in results}
+    targets = {WORKING_GROUP: {}, TOPIC: {}}
+    for operation in operations:
+        result = {
+            'entity_type': operation.get('entity_type'),
+            'entity_id': operation.get('entity_id'),
+            'action': operation.get('action'),
+        }
+        results.append(result)
+        if result['entity_type'] not in MEMBERSHIP_TABLES:
+            result.update(success=False, error='Invalid entity type')
+        elif result['action'] not in ACTION_LEVELS:
+            result.update(success=False, error='Invalid action')
+        else:
+            entity_id = result['entity_id']
+            # JSON numbers only: int() would take true or 1.5 as entity 1 (bool is an int)
+            if not isinstance(entity_id, int) or isinstance(entity_id, bool):
+                result.update(success=False, error='Invalid entity id')
+                continue
+            if entity_id in targets[result['entity_type']]:
+                result.update(success=False, error='Duplicate operation for this entity')
+                continue
+            targets[result['entity_type']][entity_id] = len(results) - 1
+
+    with transaction.atomic():
+        for entity_type, entity_targets in targets.items():
+            if entity_targets:
+                _apply_table(user, entity_type, entity_targets, results)
+        if any(result.get('success') for result in results):
+            dashboard.invalidate(user.pk)
+    return results
+
+
+def _apply_table(user, entity_type, entity_targets, results):
+    membership_model, entity_model, field = MEMBERSHIP_TABLES[entity_type]
+    entity_ids = list(entity_targets)
+
+    _lock_memberships(membership_model._meta.db_table, user.pk)
+    existing_entities = set(
+        entity_model.objects.filter(pk__in=entity_ids).values_list('pk', flat=True)
+    )
+    current = {
+        entity_id: (membership_id, level)
+        for membership_id, entity_id, level in membership_model.objects.select_for_update().filter(
+            user=user, **{f'{field}_id__in': entity_ids}
+        ).order_by().values_list('id', f'{field}_id', 'participation_level')
+    }
+
+    upserts = []
+    delete_ids = []
+    deltas = Deltas()
+    for entity_id, index in entity_targets.items():
+        result = results[index]
+        new_level = ACTION_LEVELS[result['action']]
+        membership_id, level = current.get(entity_id, (None, None))
+        if entity_id not in existing_entities:
+            result.update(success=False, error='Not found')
+            continue
+        if level == 'leader':
+            result.update(success=False, error=LEADER_ERROR)
+            continue
+
+        result.update(success=True, new_level=new_level)
+        if new_level is None:
+            if membership_id is not None:
+                delete_ids.append(membership_id)
+        elif new_level != level:
+            upserts.append(membership_model(
+                user=user, participation_level=new_level, **{f'{field}_id': entity_id}
+            ))
+        deltas.change(entity_model, entity_id, level, new_level)
+
+    if upserts:
+        membership_model.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=['user', field],
+            update_fields=['participation_level', 'updated_at'],
+        )
+    if delete_ids:
+        # Not a queryset delete: that would send post_delete for every row and
+        # core/signals.py would count each removal a second time
+        placeholders = ', '.join(['%s'] * len(delete_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {membership_model._meta.db_table} WHERE id IN ({placeholders})', delete_ids
+            )
+    deltas.apply()
+
+
+def table_sql(entity_type):
+    """(table, entity column, user column) of a membership table, for raw SQL"""
+    membership_model, _, field = MEMBERSHIP_TABLES[entity_type]
+    meta = membership_model._meta
+    return meta.db_table, meta.get_field(field).column, meta.get_field('user').column
+
+
+def _lock_memberships(table, user_id):
+    """
+    Serialize the user's membership writes on ``table`` until the transaction
+    ends. The previous levels read afterwards then include the rows inserted
+    by the user's concurrent requests (a double click, a second tab), which
+    a row lock cannot cover since those rows did not exist yet.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))', [f'{table}:{user_id}'])
+
+
+def upsert_participation(user, entity_type, entity_id, level):
+    """
+    Create or update the user's membership and its entity's counters with one
+    statement after a per-user lock: an INSERT ... ON CONFLICT DO UPDATE that
+    skips leader rows, with the previous level read and the counter UPDATE as
+    CTEs around it.
+    Returns False if the user leads the entity (nothing written), True otherwise.
+    Raises IntegrityError if the entity does not exist.
+    """
+    entity_model = MEMBERSHIP_TABLES[entity_type][1]
+    table, entity_column, user_column = table_sql(entity_type)
+    counted = update_counts_sql(entity_model, (
+        '(SELECT entity_id, (SELECT participation_level FROM old) AS old_level, new_level FROM upserted)'
+    ))
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # The statement's snapshot would miss a row inserted by the user's
+        # concurrent toggle, and count it twice; PostgreSQL 16 has no
+        # RETURNING OLD to read the previous level from the upsert itself
+        _lock_memberships(table, user.pk)
+        cursor.execute(
+            f'WITH old AS ('
+            f'  SELECT participation_level FROM {table} WHERE {user_column} = %s AND {entity_column} = %s'
+            f'), upserted AS ('
+            f'  INSERT INTO {table} ({user_column}, {entity_column}, participation_level, created_at, updated_at) '
+            f'  VALUES (%s, %s, %s, %s, %s) '
+            f'  ON CONFLICT ({user_column}, {entity_column}) DO UPDATE '
+            f'  SET participation_level = EXCLUDED.participation_level, updated_at = EXCLUDED.updated_at '
+            f"  WHERE {table}.participation_level <> 'leader' "
+            f'  RETURNING {entity_column} AS entity_id, participation_level AS new_level'
+            f'), counted AS ({counted}) '
+            f'SELECT EXISTS (SELECT 1 FROM upserted)',
+            [user.pk, entity_id, user.pk, entity_id, level, now, now],
+        )
+        if not cursor.fetchone()[0]:
+            # A leader row, which the upsert leaves untouched
+            return False
+        dashboard.invalidate(user.pk)
+        return True
+
+
+def remove_participation(user, entity_type, entity_id):
+    """
+    Delete the user's non-leader membership, update its entity's counters
+    and detect a leader row, all in one statement.
+    Returns False if the user leads the entity, True otherwise (including
+    when the user was not a member).
+    """
+    entity_model = MEMBERSHIP_TABLES[entity_type][1]
+    table, entity_column, user_column = table_sql(entity_type)
+    counted = update_counts_sql(
+        entity_model, '(SELECT entity_id, old_level, NULL::varchar AS new_level FROM deleted)'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH deleted AS ('
+            f'  DELETE FROM {table} WHERE {user_column} = %s AND {entity_column} = %s '
+            f"  AND participation_level <> 'leader' "
+            f'  RETURNING {entity_column} AS entity_id, participation_level AS old_level'
+            f'), counted AS ({counted}) '
+            f'SELECT EXISTS (SELECT 1 FROM deleted), EXISTS ('
+            f'  SELECT 1 FROM {table} WHERE {user_column} = %s AND {entity_column} = %s '
+            f"  AND participation_level = 'leader'"
+            f')',
+            [user.pk, entity_id, user.pk, entity_id],
+        )
+        removed, is_leader = cursor.fetchone()
+        if removed:
+            dashboard.invalidate(user.pk)
+        return not is_leader
@@ -0,0 +1,77 @@
+# core/sessions.py
+"""
+Session engine (SESSION_ENGINE = 'core.sessions') wrapping one of Django's
+engines, picked by SESSION_BACKEND:
+
+- ``cached_db``: read from the cache, written through to the database
+- ``cache``: cache only, sessions are lost if the cache is flushed
+- ``db``: database only
+
+Sessions are only written when their data actually changed: Django saves a
+session whenever a key was assigned, even to the value it already had.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import cache, cached_db, db
+
+
+class SkipUnchangedMixin:
+    """Skip saving a loaded session whose data is unchanged"""
+
+    _saved_data = None
+
+    def _snapshot(self, data):
+        return self.serializer().dumps(data)
+
+    def _unchanged(self, must_create):
+        """Whether the data is the same as when it was last loaded or saved"""
+        return (
+            not must_create
+            and self.session_key is not None
+            and self._saved_data is not None
+            and self._snapshot(getattr(self, '_session_cache', None)) == self._saved_data
+        )
+
+    def load(self):
+        data = super().load()
+        self._saved_data = self._snapshot(data)
+        return data
+
+    async def aload(self):
+        # Under ASGI the session is loaded here (request.auser()), and saved
+        # by the sync save() of SessionMiddleware
+        data = await super().aload()
+        self._saved_data = self._snapshot(data)
+        return data
+
+    def save(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        super().save(must_create=must_create)
+        self._saved_data = self._snapshot(self._get_session(no_load=True))
+
+    async def asave(self, must_create=False):
+        if self._unchanged(must_create):
+            return
+        await super().asave(must_create=must_create)
+        self._saved_data = self._snapshot(await self._aget_session(no_load=True))
+
+
+class CachedDBSessionStore(SkipUnchangedMixin, cached_db.SessionStore):
+    pass
+
+
+class CacheSessionStore(SkipUnchangedMixin, cache.SessionStore):
+    pass
+
+
+class DBSessionStore(SkipUnchangedMixin, db.SessionStore):
+    pass
+
+
+SESSION_STORES = {
+    'cached_db': CachedDBSessionStore,
+    'cache': CacheSessionStore,
+    'db': DBSessionStore,
+}
+
+SessionStore = SESSION_STORES[settings.SESSION_BACKEND]
@@ -0,0 +1,135 @@
+# core/signals.py
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import dashboard, hierarchy
+from .counters import Deltas, update_counts
+from .models import Project, WorkingGroup, Topic, WorkingGroupMembership, TopicMembership
+
+# Membership model -> (entity model, FK field name)
+MEMBERSHIP_ENTITIES = {
+    WorkingGroupMembership: (WorkingGroup, 'working_group'),
+    TopicMembership: (Topic, 'topic'),
+}
+
+
+def _invalidate(project_id, index=False):
+    """Bump the hierarchy versions once the surrounding transaction commits"""
+    def bump():
+        hierarchy.bump_project(project_id)
+        if index:
+            hierarchy.bump_index()
+    transaction.on_commit(bump)
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    _invalidate(instance.pk, index=True)
+
+
+@receiver(pre_save, sender=WorkingGroup)
+def working_group_saving(sender, instance, **kwargs):
+    # A working group moved to another project leaves the old project's tree stale too
+    instance._previous_project_id = None
+    if instance.pk is not None:
+        instance._previous_project_id = WorkingGroup.objects.filter(pk=instance.pk).values_list(
+            'project_id', flat=True
+        ).first()
+
+
+@receiver([post_save, post_delete], sender=WorkingGroup)
+def working_group_changed(sender, instance, **kwargs):
+    # The project list shows working group counts
+    _invalidate(instance.project_id, index=True)
+    previous = getattr(instance, '_previous_project_id', None)
+    if previous is not None and previous != instance.project_id:
+        _invalidate(previous)
+
+
+@receiver(pre_save, sender=Topic)
+def topic_saving(sender, instance, **kwargs):
+    # Same for a topic moved to a working group of another project
+    instance._previous_project_id = None
+    if instance.pk is not None:
+        instance._previous_project_id = Topic.objects.filter(pk=instance.pk).values_list(
+            'working_group__project_id', flat=True
+        ).first()
+
+
+@receiver([post_save, post_delete], sender=Topic)
+def topic_changed(sender, instance, **kwargs):
+    project_id = WorkingGroup.objects.filter(pk=instance.working_group_id).values_list(
+        'project_id', flat=True
+    ).first()
+    if project_id is not None:
+        _invalidate(project_id)
+    previous = getattr(instance, '_previous_project_id', None)
+    if previous is not None and previous != project_id:
+        _invalidate(previous)
+
+
+# Membership counters for saves and deletes through the ORM (admin, shell,
+# cascades). core/participation.py maintains them itself for its bulk and
+# raw SQL writes, which send no signals. Those never touch leader rows, while
+# a leader change here invalidates the cached participation table.
+# With these receivers a cascading delete loads its memberships instead of
+# deleting them in one statement, and deleting a user runs a counter UPDATE
+# per membership. Large removals should delete the memberships in SQL first
+# and reconcile the counters (see seed_scale --clear).
+
+def _leader_changed(entity_model, entity_id):
+    if entity_model is WorkingGroup:
+        project_id = WorkingGroup.objects.filter(pk=entity_id).values_list('project_id', flat=True).first()
+    else:
+        project_id = Topic.objects.filter(pk=entity_id).values_list(
+            'working_group__project_id', flat=True
+        ).first()
+    if project_id is not None:
+        _invalidate(project_id)
+
+@receiver(pre_save, sender=WorkingGroupMembership)
+@receiver(pre_save, sender=TopicMembership)
+def membership_saving(sender, instance, **kwargs):
+    _, field = MEMBERSHIP_ENTITIES[sender]
+    instance._counted_as = None
+    if instance.pk is not None:
+        instance._counted_as = sender.objects.filter(pk=instance.pk).values_list(
+            f'{field}_id', 'participation_level'
+        ).first()
+
+
+@receiver(post_save, sender=WorkingGroupMembership)
+@receiver(post_save, sender=TopicMembership)
+def membership_saved(sender, instance, **kwargs):
+    entity_model, field = MEMBERSHIP_ENTITIES[sender]
+    entity_id = getattr(instance, f'{field}_id')
+    old_entity_id, old_level = getattr(instance, '_counted_as', None) or (entity_id, None)
+    deltas = Deltas()
+    if old_entity_id != entity_id:
+        deltas.change(entity_model, old_entity_id, old_level, None)
+        if old_level == 'leader':
+            _leader_changed(entity_model, old_entity_id)
+        old_level = None
+    deltas.change(entity_model, entity_id, old_level, instance.participation_level)
+    deltas.apply()
+    if 'leader' in (old_level, instance.participation_level):
+        _leader_changed(entity_model, entity_id)
+    dashboard.invalidate(instance.user_id)
+    instance._counted_as = (entity_id, instance.participation_level)
+
+
+@receiver(post_delete, sender=WorkingGroupMembership)
+@receiver(post_delete, sender=TopicMembership)
+def membership_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting a project, working group or topic takes its counters with it
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Project, WorkingGroup, Topic):
+        return
+    entity_model, field = MEMBERSHIP_ENTITIES[sender]
+    entity_id = getattr(instance, f'{field}_id')
+    update_counts(entity_model, entity_id, instance.participation_level, None)
+    if instance.participation_level == 'leader':
+        _leader_changed(entity_model, entity_id)
+    dashboard.invalidate(instance.user_id)
@@ -1,3 +1,1248 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import threading
+import time
+import unittest
+import zlib
+from importlib import import_module
+from itertools import product
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import brotli
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from requests import HTTPError
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+
+from . import async_views, dashboard, events, export, fragments, hierarchy, importer, jwks, matrix, metrics, views
+from .participation import WORKING_GROUP, apply_operations, remove_participation, upsert_participation
+from .sessions import SESSION_STORES
+from .auth import KeycloakOIDCBackend, _users_group_id
+from .middleware import CompressionMiddleware, QueryStats
+from .models import ParticipationFact, Project, Topic, TopicMembership, WorkingGroup, WorkingGroupMembership
+
+User = get_user_model()
+
+
+class ProjectDataMixin:
+    """A project with one working group, one topic and a logged in member"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        cls.project = Project.objects.create(name='Project')
+        cls.working_group = WorkingGroup.objects.create(project=cls.project, name='WG')
+        cls.topic = Topic.objects.create(working_group=cls.working_group, name='Topic')
+
+    def setUp(self):
+        # Cached trees and versions outlive the rolled back test data
+        caches['default'].clear()
+        self.client.force_login(self.user)
+
+    def get(self, path, **kwargs):
+        # SECURE_SSL_REDIRECT is on
+        return self.client.get(path, secure=True, **kwargs)
+
+    def join(self, user, level='subscriber', topic=False):
+        if topic:
+            return TopicMembership.objects.create(user=user, topic=self.topic, participation_level=level)
+        return WorkingGroupMembership.objects.create(
+            user=user, working_group=self.working_group, participation_level=level
+        )
+
+
+def streamed(response):
+    return b''.join(response.streaming_content).decode()
+
+
+class UsersParticipationMatrixTests(ProjectDataMixin, TestCase):
+
+    def test_project_without_members(self):
+        response = self.get('/users_matrix/', query_params={'project': self.project.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('No users found.', streamed(response))
+
+    def test_search_without_matches(self):
+        self.join(self.user)
+        response = self.get('/users_matrix/', query_params={'project': self.project.id, 'q': 'nobody'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('No users found.', streamed(response))
+
+    def test_rows(self):
+        self.join(self.user, 'contributor')
+        response = self.get('/users_matrix/', query_params={'project': self.project.id})
+        html = streamed(response)
+        self.assertIn('alice', html)
+        self.assertNotIn('No users found.', html)
+
+    def test_cells_without_column_are_skipped(self):
+        # A working group created between reading the columns and the cells
+        columns = matrix.build_columns(self.project)
+        self.join(self.user)
+        other = WorkingGroup.objects.create(project=self.project, name='Late')
+        WorkingGroupMembership.objects.create(user=self.user, working_group=other, participation_level='leader')
+        cells = matrix.membership_cells(self.project, [self.user.id])
+        rows = list(matrix.iter_rows([self.user], columns, cells))
+        self.assertEqual(len(rows[0]['statuses']), len(columns))
+        self.assertIn('S', rows[0]['statuses'])
+
+
+class ExportTests(ProjectDataMixin, TestCase):
+
+    def test_wide_export(self):
+        self.join(self.user, 'contributor')
+        self.join(self.user, topic=True)
+        text = ''.join(export.export(self.project, layout='wide'))
+        self.assertEqual(text.splitlines()[1], 'alice,,,C,S')
+
+    def test_wide_cells_without_column_are_skipped(self):
+        columns = matrix.build_columns(self.project)
+        self.join(self.user, 'contributor')
+        other = WorkingGroup.objects.create(project=self.project, name='Late')
+        WorkingGroupMembership.objects.create(user=self.user, working_group=other, participation_level='leader')
+        rows = list(export.iter_wide(export.cells_queryset(self.project), columns))
+        self.assertEqual(rows, [('alice', '', '', 'C', '')])
+
+    def test_parquet_export(self):
+        import pyarrow.parquet as pq
+
+        self.join(self.user, 'contributor')
+        self.join(self.user, topic=True)
+        data = b''.join(export.export(self.project, file_format='parquet', chunk_size=1))
+        table = pq.read_table(io.BytesIO(data))
+        self.assertEqual(table.column_names, export.LONG_HEADER)
+        self.assertEqual(sorted(table.to_pylist(), key=lambda row: row['level']), [
+            {'username': 'alice', 'first_name': None, 'last_name': None,
+             'working_group': 'WG', 'topic': None, 'level': 'contributor'},
+            {'username': 'alice', 'first_name': None, 'last_name': None,
+             'working_group': 'WG', 'topic': 'Topic', 'level': 'subscriber'},
+        ])
+
+
+class HierarchyInvalidationTests(ProjectDataMixin, TestCase):
+
+    def test_moved_working_group_leaves_old_project(self):
+        other = Project.objects.create(name='Other')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(hierarchy.get_project_tree(self.project.id)['working_groups']), 1)
+            self.working_group.project = other
+            self.working_group.save()
+        self.assertEqual(hierarchy.get_project_tree(self.project.id)['working_groups'], [])
+        self.assertEqual(len(hierarchy.get_project_tree(other.id)['working_groups']), 1)
+
+    def test_moved_topic_leaves_old_project(self):
+        other = Project.objects.create(name='Other')
+        other_wg = WorkingGroup.objects.create(project=other, name='Other WG')
+        self.assertEqual(len(hierarchy.get_project_tree(self.project.id)['working_groups'][0]['topics']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic.working_group = other_wg
+            self.topic.save()
+        self.assertEqual(hierarchy.get_project_tree(self.project.id)['working_groups'][0]['topics'], [])
+
+
+class BulkParticipationTests(ProjectDataMixin, TestCase):
+
+    def post(self, operations):
+        return self.client.post(
+            '/bulk-participation/', json.dumps({'operations': operations}),
+            content_type='application/json', secure=True,
+        )
+
+    def test_applies_operations(self):
+        response = self.post([
+            {'entity_type': 'working_group', 'entity_id': self.working_group.id, 'action': 'contribute'},
+            {'entity_type': 'topic', 'entity_id': self.topic.id, 'action': 'subscribe'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(
+            WorkingGroupMembership.objects.get(user=self.user).participation_level, 'contributor'
+        )
+        self.assertEqual(TopicMembership.objects.get(user=self.user).participation_level, 'subscriber')
+
+    def test_rejects_entity_ids_that_are_not_integers(self):
+        for entity_id in (True, 1.5, '1', None):
+            with self.subTest(entity_id=entity_id):
+                response = self.post([{'entity_type': 'working_group', 'entity_id': entity_id, 'action': 'subscribe'}])
+                result = response.json()['results'][0]
+                self.assertFalse(result['success'])
+                self.assertEqual(result['error'], 'Invalid entity id')
+        self.assertFalse(WorkingGroupMembership.objects.exists())
+
+
+class MembershipApiTests(ProjectDataMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bob = User.objects.create_user('bob')
+        self.join(self.user)
+        self.join(self.bob, 'contributor')
+        self.join(self.user, topic=True)
+        self.url = f'/api/projects/{self.project.id}/memberships/'
+
+    def test_pages(self):
+        first = self.get(self.url, query_params={'limit': 2}).json()
+        self.assertEqual([row['type'] for row in first['results']], ['working_group', 'working_group'])
+        second = self.get(first['next']).json()
+        self.assertEqual([row['type'] for row in second['results']], ['topic'])
+        self.assertIsNone(second['next'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('wg.1', 'topic.', 'topic.-1', 'topic.²', 'topic.١'):
+            with self.subTest(cursor=cursor):
+                response = self.get(self.url, query_params={'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_not_modified_skips_the_page_query(self):
+        response = self.get(self.url, query_params={'limit': 2})
+        etag = response.headers['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(self.url, query_params={'limit': 2}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # Only the fingerprint, which does not read the levels
+        self.assertFalse([query for query in queries if 'participation_level' in query['sql']])
+
+    def test_etag_follows_the_page(self):
+        etag = self.get(self.url, query_params={'limit': 2}).headers['ETag']
+        # Beyond the page and the row telling there is a next one
+        TopicMembership.objects.create(
+            user=self.bob, topic=Topic.objects.create(working_group=self.working_group, name='Other'),
+            participation_level='subscriber',
+        )
+        self.assertEqual(self.get(self.url, query_params={'limit': 2}).headers['ETag'], etag)
+        membership = WorkingGroupMembership.objects.get(user=self.bob)
+        membership.participation_level = 'subscriber'
+        for change in (membership.save, membership.delete):
+            change()
+            new_etag = self.get(self.url, query_params={'limit': 2}).headers['ETag']
+            self.assertNotEqual(new_etag, etag)
+            etag = new_etag
+
+
+class ProjectApiTests(ProjectDataMixin, TestCase):
+
+    def test_bodies_do_not_come_from_a_stale_cache(self):
+        # As in a worker whose local cache missed another worker's change
+        hierarchy.get_project_index()
+        hierarchy.get_project_tree(self.project.id)
+        Project.objects.filter(pk=self.project.pk).update(name='Renamed', updated_at=timezone.now())
+        WorkingGroup.objects.filter(pk=self.working_group.pk).update(name='Renamed WG', updated_at=timezone.now())
+
+        self.assertEqual(self.get('/api/projects/').json()['results'][0]['name'], 'Renamed')
+        tree = self.get(f'/api/projects/{self.project.id}/').json()
+        self.assertEqual(tree['working_groups'][0]['name'], 'Renamed WG')
+
+    def test_head(self):
+        for url in ('/api/projects/', f'/api/projects/{self.project.id}/'):
+            with self.subTest(url=url):
+                response = self.client.head(url, secure=True)
+                self.assertEqual(response.status_code, 200)
+                response = self.client.head(url, secure=True, headers={'If-None-Match': response.headers['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+
+class ImportMembershipsTests(ProjectDataMixin, TestCase):
+
+    def test_entity_ids_beyond_32_bits(self):
+        working_group = WorkingGroup.objects.create(pk=2 ** 31 + 1, project=self.project, name='Big')
+        result = importer.import_memberships([(2, {
+            'username': 'alice', 'project': 'Project', 'working_group': 'Big', 'topic': '', 'level': 'contributor',
+        })])
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.changes['working_group']['created'], 1)
+        working_group.refresh_from_db()
+        self.assertEqual(working_group.contributor_count, 1)
+        self.assertEqual(WorkingGroupMembership.objects.get(user=self.user).working_group_id, 2 ** 31 + 1)
+
+    def test_changed_users_dashboards_are_dropped(self):
+        bob = User.objects.create_user('bob')
+        self.join(bob, 'contributor')
+        dashboard.get_dashboard(self.user.pk)
+        dashboard.get_dashboard(bob.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            importer.import_memberships([(line, {
+                'username': username, 'project': 'Project', 'working_group': 'WG', 'topic': '', 'level': 'contributor',
+            }) for line, username in [(2, 'alice'), (3, 'bob')]])
+        cached = caches['default'].get_many([dashboard.DASHBOARD_KEY.format(pk) for pk in (self.user.pk, bob.pk)])
+        # Bob's membership was already at that level
+        self.assertEqual(list(cached), [dashboard.DASHBOARD_KEY.format(bob.pk)])
+        self.assertEqual(len(dashboard.get_dashboard(self.user.pk)), 1)
+
+
+class ParticipationFactSyncTests(ProjectDataMixin, TestCase):
+    """The triggers of migration 0004 keep the facts equal to the membership tables"""
+
+    def assert_in_sync(self, count):
+        migration = import_module('core.migrations.0004_participation_fact')
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {migration.FACTS_COLUMNS} FROM core_participation_fact ORDER BY 1, 2')
+            facts = cursor.fetchall()
+            cursor.execute(f'SELECT * FROM ({migration.FACTS_SELECT}) memberships ORDER BY 1, 2')
+            self.assertEqual(facts, cursor.fetchall())
+        self.assertEqual(len(facts), count)
+
+    def test_insert_update_delete(self):
+        bob = User.objects.create_user('bob')
+        self.join(self.user)
+        self.join(self.user, topic=True)
+        WorkingGroupMembership.objects.bulk_create([
+            WorkingGroupMembership(user=bob, working_group=self.working_group, participation_level='contributor'),
+        ])
+        self.assert_in_sync(3)
+
+        membership = WorkingGroupMembership.objects.get(user=self.user)
+        membership.participation_level = 'leader'
+        membership.save()
+        TopicMembership.objects.update(participation_level='contributor')
+        self.assert_in_sync(3)
+        self.assertEqual(ParticipationFact.objects.get(membership_type='topic').participation_level, 'contributor')
+
+        membership.delete()
+        self.assert_in_sync(2)
+        TopicMembership.objects.all().delete()
+        self.assert_in_sync(1)
+
+    def test_truncate(self):
+        self.join(self.user)
+        self.join(self.user, topic=True)
+        with connection.cursor() as cursor:
+            # TRUNCATE refuses to run with the inserts' foreign key checks still deferred
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'TRUNCATE {TopicMembership._meta.db_table}')
+        self.assert_in_sync(1)
+
+    def test_moves(self):
+        self.join(self.user)
+        self.join(self.user, topic=True)
+        other_project = Project.objects.create(name='Other')
+        other_group = WorkingGroup.objects.create(project=other_project, name='Other WG')
+
+        self.topic.working_group = other_group
+        self.topic.save()
+        self.assert_in_sync(2)
+        self.assertEqual(ParticipationFact.objects.get(membership_type='topic').project_id, other_project.pk)
+
+        WorkingGroup.objects.filter(pk=self.working_group.pk).update(project=other_project)
+        self.assert_in_sync(2)
+        self.assertEqual(set(ParticipationFact.objects.values_list('project_id', flat=True)), {other_project.pk})
+
+
+class QueryInstrumentationTests(ProjectDataMixin, TestCase):
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/projects/table/')
+        match = re.fullmatch(
+            r'sql;dur=[\d.]+;desc="(\d+) queries, (\d+) duplicates", app;dur=[\d.]+', response['Server-Timing']
+        )
+        self.assertIsNotNone(match, response['Server-Timing'])
+        self.assertEqual(int(match[1]), len(queries))
+
+    @override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0.5)
+    def test_sampling(self):
+        for draw, sampled in [(0.3, True), (0.7, False)]:
+            with self.subTest(draw=draw), mock.patch('core.middleware.random.random', return_value=draw):
+                self.assertEqual('Server-Timing' in self.get('/projects/table/'), sampled)
+
+    @override_settings(QUERY_COUNT_THRESHOLD=1)
+    def test_threshold_logs_warning(self):
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            self.get('/projects/table/')
+        self.assertIn('view=core:hierarchy_table', logs.output[0])
+        self.assertEqual(logs.records[0].flags, ['query_count'])
+
+    def test_duplicates(self):
+        stats = QueryStats()
+        for sql in ['SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 1']:
+            stats(lambda *args: None, sql, None, False, {})
+        self.assertEqual((stats.count, stats.duplicates), (4, 2))
+        self.assertEqual(stats.most_repeated(), ('SELECT 1', 3))
+
+
+class QueryCountTests(ProjectDataMixin, TestCase):
+    """Page queries do not grow with the number of projects, entities or memberships"""
+
+    def count_queries(self, path):
+        caches['default'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def grow(self):
+        others = [User.objects.create_user(f'user{i}') for i in range(3)]
+        for i in range(3):
+            project = Project.objects.create(name=f'Project {i}')
+            for j in range(2):
+                working_group = WorkingGroup.objects.create(project=project, name=f'WG {i}.{j}')
+                for k in range(3):
+                    topic = Topic.objects.create(working_group=working_group, name=f'Topic {i}.{j}.{k}')
+                    for user, level in zip([self.user, *others], ['subscriber', 'leader', 'contributor', 'subscriber']):
+                        TopicMembership.objects.create(user=user, topic=topic, participation_level=level)
+
+    def test_hierarchy_table(self):
+        self.join(self.user, topic=True)
+        queries, _ = self.count_queries('/projects/table/')
+        self.grow()
+        grown, response = self.count_queries('/projects/table/')
+        self.assertEqual(grown, queries)
+        self.assertContains(response, '<span class="badge bg-success">Subscriber</span>', count=19)
+
+    def test_project_list(self):
+        queries, _ = self.count_queries('/projects/')
+        self.grow()
+        grown, response = self.count_queries('/projects/')
+        self.assertEqual(grown, queries)
+        self.assertContains(response, 'Project 2')
+
+    def test_project_participation_table(self):
+        path = f'/projects/participation/?project={self.project.pk}'
+        self.join(self.user, topic=True)
+        queries, _ = self.count_queries(path)
+        # Leaders and many members per entity
+        members = User.objects.bulk_create([User(username=f'member{i}') for i in range(50)])
+        leader = User.objects.create_user('leader')
+        for i in range(3):
+            topic = Topic.objects.create(working_group=self.working_group, name=f'Topic {i}')
+            TopicMembership.objects.create(user=leader, topic=topic, participation_level='leader')
+            TopicMembership.objects.bulk_create([
+                TopicMembership(user=member, topic=topic, participation_level='subscriber') for member in members
+            ])
+        WorkingGroupMembership.objects.create(user=leader, working_group=self.working_group, participation_level='leader')
+        grown, response = self.count_queries(path)
+        self.assertEqual(grown, queries)
+        leaders = re.findall(r'data-leader="[^"]+">\s*(\w+)\s*<', response.content.decode())
+        self.assertEqual(leaders, ['leader'] * 4)
+        self.assertNotContains(response, 'member0')
+
+
+class SyncUserDataTests(TestCase):
+
+    claims = {
+        'email': 'alice@example.com', 'given_name': 'Alice', 'family_name': 'Doe',
+        'realm_access': {'roles': ['user']},
+    }
+
+    def setUp(self):
+        # The cached group id would outlive the rolled back group
+        _users_group_id.cache_clear()
+        self.backend = KeycloakOIDCBackend()
+        self.user = User.objects.create_user('alice')
+
+    def login(self, claims):
+        with CaptureQueriesContext(connection) as queries:
+            self.backend.update_user(self.user, claims)
+        return [query['sql'] for query in queries if not query['sql'].startswith('SELECT')]
+
+    def test_unchanged_login_does_not_write(self):
+        self.assertTrue(self.login(self.claims))
+        self.assertEqual(self.login(self.claims), [])
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.email, self.user.first_name), ('alice@example.com', 'Alice'))
+        self.assertTrue(self.user.groups.filter(name='users').exists())
+
+    def test_only_changed_fields_are_saved(self):
+        self.login(self.claims)
+        writes = self.login({**self.claims, 'given_name': 'Alicia'})
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"first_name"', writes[0])
+        self.assertNotIn('"email"', writes[0])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Alicia')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'psycopg_pool')
+class DatabaseConnectionTests(TestCase):
+    """The pooled and persistent connection settings, on a second connection to the test database"""
+
+    def settings(self, **environ):
+        with mock.patch.dict('os.environ', environ):
+            module = importlib.util.module_from_spec(importlib.util.find_spec('faberorg.settings'))
+            module.__spec__.loader.exec_module(module)
+        return module.DATABASES['default']
+
+    def test_settings(self):
+        pooled = self.settings(DB_POOL='True', DB_POOL_MIN_SIZE='2', DB_POOL_MAX_SIZE='8', DB_POOL_TIMEOUT='3')
+        self.assertTrue(pooled['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('CONN_MAX_AGE', pooled)
+        self.assertEqual(
+            {key: pooled['OPTIONS']['pool'][key] for key in ('min_size', 'max_size', 'timeout')},
+            {'min_size': 2, 'max_size': 8, 'timeout': 3.0},
+        )
+        persistent = self.settings(DB_POOL='False', DB_CONN_MAX_AGE='30')
+        self.assertTrue(persistent['CONN_HEALTH_CHECKS'])
+        self.assertEqual(persistent['CONN_MAX_AGE'], 30)
+        self.assertNotIn('pool', persistent.get('OPTIONS', {}))
+
+    def wrapper(self, **settings_dict):
+        default = connections['default']
+        wrapper = type(default)({**default.settings_dict, 'CONN_HEALTH_CHECKS': True, **settings_dict}, 'other')
+        self.addCleanup(wrapper.close_pool if 'OPTIONS' in settings_dict else wrapper.close)
+        return wrapper
+
+    def request(self, wrapper):
+        """Run a query the way a request does, returning the backend pid"""
+        wrapper.close_if_unusable_or_obsolete()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+        wrapper.close_if_unusable_or_obsolete()
+        return pid
+
+    def terminate(self, pid):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+
+    def test_pool_reuses_and_checks_connections(self):
+        wrapper = self.wrapper(CONN_MAX_AGE=0, OPTIONS={'pool': {'min_size': 1, 'max_size': 1}})
+        pid = self.request(wrapper)
+        self.assertEqual(self.request(wrapper), pid)
+        self.terminate(pid)
+        self.assertNotEqual(self.request(wrapper), pid)
+        self.assertEqual(wrapper.pool.get_stats()['requests_num'], 3)
+        # Exported on /metrics
+        with mock.patch.object(metrics, 'connections', mock.Mock(all=lambda: [wrapper])):
+            metrics.record_db_pools()
+        self.assertEqual(REGISTRY.get_sample_value('faberorg_db_pool', {'alias': 'other', 'stat': 'requests_num'}), 3)
+
+    def test_persistent_connection_is_checked(self):
+        wrapper = self.wrapper(CONN_MAX_AGE=60)
+        pid = self.request(wrapper)
+        self.assertEqual(self.request(wrapper), pid)
+        self.terminate(pid)
+        self.assertNotEqual(self.request(wrapper), pid)
+
+
+class AsyncViewsTests(ProjectDataMixin, TestCase):
+    """core.async_views render what their sync counterparts in core.views render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        bob = User.objects.create_user('bob')
+        TopicMembership.objects.create(user=cls.user, topic=cls.topic, participation_level='contributor')
+        WorkingGroupMembership.objects.create(user=bob, working_group=cls.working_group, participation_level='leader')
+
+    def request(self, path):
+        async def auser():
+            return self.user
+        request = RequestFactory().get(path, secure=True)
+        request.user, request.auser, request.session = self.user, auser, self.client.session
+        return request
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            parts = response.streaming_content
+            if response.is_async:
+                async def read():
+                    return [part async for part in parts]
+                parts = async_to_sync(read)()
+            else:
+                parts = list(parts)
+            body = b''.join(part.encode() if isinstance(part, str) else part for part in parts)
+        else:
+            body = response.content
+        # Masked differently on every render
+        return re.sub(rb'name="csrfmiddlewaretoken" value="\w+"', b'', body).decode()
+
+    def test_same_output(self):
+        project, topic = self.project.pk, self.topic.pk
+        for name, path, kwargs in [
+            ('project_list', '/projects/', {}),
+            ('project_detail', f'/projects/{project}/', {'pk': project}),
+            ('topic_detail', f'/topics/{topic}/', {'pk': topic}),
+            ('hierarchy_table', '/projects/table/', {}),
+            ('my_participation', '/me/participation/', {}),
+            ('project_participation_table', f'/projects/participation/?project={project}', {}),
+            ('users_participation_matrix', f'/users_matrix/?project={project}', {}),
+            ('users_participation_export', f'/users_matrix/export/?project={project}&layout=wide', {}),
+        ]:
+            with self.subTest(view=name):
+                caches['default'].clear()
+                expected = self.content(getattr(views, name)(self.request(path), **kwargs))
+                caches['default'].clear()
+                actual = self.content(async_to_sync(getattr(async_views, name))(self.request(path), **kwargs))
+                self.assertEqual(actual, expected)
+                self.assertIn('alice', expected)
+
+
+class ParticipationFragmentTests(ProjectDataMixin, TestCase):
+    """The shared participation table is cached per project version and filled in per user"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bob = User.objects.create_user('bob')
+        cls.other_topic = Topic.objects.create(working_group=cls.working_group, name='Other topic')
+        WorkingGroupMembership.objects.create(user=cls.user, working_group=cls.working_group, participation_level='subscriber')
+        TopicMembership.objects.create(user=cls.user, topic=cls.topic, participation_level='contributor')
+        TopicMembership.objects.create(user=cls.bob, topic=cls.other_topic, participation_level='leader')
+
+    def assert_cells(self, html, entity_type, entity_id, level):
+        for slot in ('status', 'actions'):
+            cell = fragments.slot_templates()[f'{entity_type}:{slot}:{level or ""}'].replace('__entity_id__', str(entity_id))
+            self.assertRegex(html, re.escape(f'data-slot="{entity_type}:{entity_id}:{slot}">') + r'\s*' + re.escape(cell))
+
+    def page(self, user):
+        self.client.force_login(user)
+        return self.get(f'/projects/participation/?project={self.project.pk}').content.decode()
+
+    def test_cells_of_each_user(self):
+        # Bob's request renders and caches the shared table that Alice's request reuses
+        bob_page = self.page(self.bob)
+        self.assert_cells(bob_page, 'topic', self.other_topic.pk, 'leader')
+        self.assert_cells(bob_page, 'topic', self.topic.pk, None)
+        self.assert_cells(bob_page, 'working_group', self.working_group.pk, None)
+
+        alice_page = self.page(self.user)
+        self.assert_cells(alice_page, 'topic', self.topic.pk, 'contributor')
+        self.assert_cells(alice_page, 'topic', self.other_topic.pk, None)
+        self.assert_cells(alice_page, 'working_group', self.working_group.pk, 'subscriber')
+        self.assertNotIn('Leader (cannot modify)', alice_page.split('id="participation-slots"')[0])
+        self.assertNotIn('<!--participation:', alice_page)
+
+    def test_shared_table_is_cached_per_version(self):
+        project = hierarchy.get_project_tree(self.project.pk)
+        html = fragments.participation_table(project)
+        with self.assertNumQueries(0):
+            self.assertEqual(fragments.participation_table(project), html)
+        # A new leader bumps the project version (core/signals.py)
+        membership = TopicMembership.objects.get(topic=self.topic)
+        membership.participation_level = 'leader'
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.save()
+        html = fragments.participation_table(hierarchy.get_project_tree(self.project.pk))
+        self.assertRegex(html, r'data-leader="topic:%d">\s*alice\s*<' % self.topic.pk)
+
+
+class ToggleParticipationTests(ProjectDataMixin, TestCase):
+
+    def toggle(self, action, entity_type='working_group', entity_id=None):
+        return self.client.post('/toggle-participation/', {
+            'entity_type': entity_type,
+            'entity_id': self.working_group.id if entity_id is None else entity_id,
+            'action': action,
+        }, secure=True)
+
+    def test_subscribe_and_unassign(self):
+        response = self.toggle('subscribe')
+        self.assertEqual(response.json(), {'success': True, 'new_level': 'subscriber'})
+        self.assertEqual(WorkingGroupMembership.objects.get(user=self.user).participation_level, 'subscriber')
+        self.assertEqual(self.toggle('unassign').status_code, 200)
+        self.assertFalse(WorkingGroupMembership.objects.exists())
+
+    def test_counters_follow_level_changes(self):
+        for action, counts in [('subscribe', (1, 0)), ('contribute', (0, 1)), ('unassign', (0, 0))]:
+            with self.subTest(action=action):
+                self.toggle(action)
+                self.working_group.refresh_from_db()
+                self.assertEqual((self.working_group.subscriber_count, self.working_group.contributor_count), counts)
+
+    def test_leader_cannot_change(self):
+        self.join(self.user, 'leader')
+        response = self.toggle('subscribe')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(WorkingGroupMembership.objects.get(user=self.user).participation_level, 'leader')
+
+    def test_one_statement_per_toggle(self):
+        # The upsert takes the user's advisory lock first; the savepoints are TestCase's
+        for level, statements in [('subscriber', 2), ('contributor', 2), (None, 1)]:
+            with self.subTest(level=level), CaptureQueriesContext(connection) as queries:
+                if level is None:
+                    remove_participation(self.user, WORKING_GROUP, self.working_group.id)
+                else:
+                    upsert_participation(self.user, WORKING_GROUP, self.working_group.id, level)
+                executed = [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+                self.assertEqual(len(executed), statements, executed)
+                self.working_group.refresh_from_db()
+                self.assertEqual(
+                    (self.working_group.subscriber_count, self.working_group.contributor_count),
+                    {'subscriber': (1, 0), 'contributor': (0, 1), None: (0, 0)}[level],
+                )
+
+    def test_leader_keeps_counters(self):
+        self.join(self.user, 'leader')
+        self.working_group.refresh_from_db()
+        before = self.working_group.leader_count
+        self.assertFalse(upsert_participation(self.user, WORKING_GROUP, self.working_group.id, 'subscriber'))
+        self.assertFalse(remove_participation(self.user, WORKING_GROUP, self.working_group.id))
+        self.working_group.refresh_from_db()
+        self.assertEqual(
+            (self.working_group.subscriber_count, self.working_group.leader_count), (0, before)
+        )
+
+
+class MyParticipationTests(ProjectDataMixin, TestCase):
+    """The cached dashboard is dropped by the user's own toggles and bulk operations"""
+
+    def levels(self):
+        projects = self.get('/me/participation/').context['projects']
+        return [
+            (wg['name'], wg['level'], [(topic['name'], topic['level']) for topic in wg['topics']])
+            for project in projects for wg in project['working_groups']
+        ]
+
+    def post(self, path, data, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(path, data, secure=True, **kwargs)
+        self.assertEqual(response.status_code, 200)
+
+    def test_toggle(self):
+        self.assertEqual(self.levels(), [])
+        for action, levels in [
+            ('subscribe', [('WG', 'subscriber', [])]),
+            ('contribute', [('WG', 'contributor', [])]),
+            ('unassign', []),
+        ]:
+            with self.subTest(action=action):
+                self.post('/toggle-participation/', {
+                    'entity_type': 'working_group', 'entity_id': self.working_group.id, 'action': action,
+                })
+                self.assertEqual(self.levels(), levels)
+
+    def test_bulk(self):
+        self.assertEqual(self.levels(), [])
+        self.post('/bulk-participation/', json.dumps({'operations': [
+            {'entity_type': 'working_group', 'entity_id': self.working_group.id, 'action': 'contribute'},
+            {'entity_type': 'topic', 'entity_id': self.topic.id, 'action': 'subscribe'},
+        ]}), content_type='application/json')
+        self.assertEqual(self.levels(), [('WG', 'contributor', [('Topic', 'subscriber')])])
+
+    def test_unchanged_dashboard_stays_cached(self):
+        self.join(self.user, 'leader')
+        self.levels()
+        # A leader's toggle changes nothing and keeps the entry
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/toggle-participation/', {
+                'entity_type': 'working_group', 'entity_id': self.working_group.id, 'action': 'subscribe',
+            }, secure=True)
+        self.assertIsNotNone(caches['default'].get(dashboard.DASHBOARD_KEY.format(self.user.pk)))
+        self.assertEqual(self.levels(), [('WG', 'leader', [])])
+
+
+class ToggleUnknownEntityTests(TransactionTestCase):
+    # Foreign keys are checked when the toggle's transaction commits, which
+    # TestCase's surrounding transaction would postpone
+
+    def test_unknown_entity(self):
+        self.client.force_login(User.objects.create_user('alice'))
+        response = self.client.post('/toggle-participation/', {
+            'entity_type': 'working_group', 'entity_id': 1000, 'action': 'subscribe',
+        }, secure=True)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'success': False, 'error': 'Not found'})
+
+
+class MetricsViewTests(SimpleTestCase):
+
+    def get(self, **headers):
+        return self.client.get('/metrics', headers=headers)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_hidden_without_token(self):
+        self.assertEqual(self.get().status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_open_with_debug(self):
+        self.assertEqual(self.get().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(Authorization='Bearer other').status_code, 403)
+        response = self.get(Authorization='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'faberorg_request_duration_seconds', response.content)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Row and advisory locks')
+class ConcurrentParticipationTests(TransactionTestCase):
+    """Two requests of the same user creating the same membership at once"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.working_group = WorkingGroup.objects.create(project=Project.objects.create(name='Project'), name='WG')
+
+    def in_thread(self, target):
+        def run():
+            try:
+                target()
+            finally:
+                connections.close_all()
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def wait_for_lock_wait(self):
+        with connection.cursor() as cursor:
+            for _ in range(100):
+                cursor.execute('SELECT count(*) FROM pg_locks WHERE NOT granted')
+                if cursor.fetchone()[0]:
+                    return
+                time.sleep(0.05)
+        self.fail('The second write did not wait for the first one')
+
+    def assert_counted_once(self, second_write):
+        inserted, commit = threading.Event(), threading.Event()
+
+        def first():
+            with transaction.atomic():
+                upsert_participation(self.user, WORKING_GROUP, self.working_group.id, 'subscriber')
+                inserted.set()
+                commit.wait(10)
+
+        first_thread = self.in_thread(first)
+        inserted.wait(10)
+        second_thread = self.in_thread(second_write)
+        # The second write must have read the old level before the first commits
+        self.wait_for_lock_wait()
+        commit.set()
+        first_thread.join()
+        second_thread.join()
+
+        self.working_group.refresh_from_db()
+        self.assertEqual(WorkingGroupMembership.objects.get().participation_level, 'contributor')
+        self.assertEqual((self.working_group.subscriber_count, self.working_group.contributor_count), (0, 1))
+
+    def test_concurrent_toggles(self):
+        self.assert_counted_once(lambda: upsert_participation(
+            self.user, WORKING_GROUP, self.working_group.id, 'contributor'
+        ))
+
+    def test_concurrent_toggle_and_bulk(self):
+        self.assert_counted_once(lambda: apply_operations(self.user, [
+            {'entity_type': WORKING_GROUP, 'entity_id': self.working_group.id, 'action': 'contribute'},
+        ]))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY')
+class ParticipationEventsTests(TransactionTestCase):
+    """Membership writes reaching the events stream through NOTIFY"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.project = Project.objects.create(name='Project')
+        self.working_group = WorkingGroup.objects.create(project=self.project, name='WG')
+        self.client.force_login(self.user)
+
+    def listen(self):
+        import psycopg
+
+        params = connection.get_connection_params()
+        params.pop('cursor_factory', None)
+        params.pop('context', None)
+        listener = psycopg.connect(**params, autocommit=True)
+        self.addCleanup(listener.close)
+        listener.execute(f'LISTEN {events.CHANNEL}')
+        return listener
+
+    def notifications(self, listener, count):
+        return [json.loads(notify.payload) for notify in listener.notifies(timeout=5, stop_after=count)]
+
+    def test_payload(self):
+        listener = self.listen()
+        upsert_participation(self.user, WORKING_GROUP, self.working_group.id, 'subscriber')
+        upsert_participation(self.user, WORKING_GROUP, self.working_group.id, 'contributor')
+        remove_participation(self.user, WORKING_GROUP, self.working_group.id)
+        change = {'type': 'working_group', 'id': self.working_group.id, 'user': 'alice'}
+        self.assertEqual(self.notifications(listener, 3), [
+            {'project': self.project.pk, 'changes': [{**change, 'old': None, 'level': 'subscriber'}]},
+            {'project': self.project.pk, 'changes': [{**change, 'old': 'subscriber', 'level': 'contributor'}]},
+            {'project': self.project.pk, 'changes': [{**change, 'old': 'contributor', 'level': None}]},
+        ])
+
+    def test_large_statement_sends_reload(self):
+        limit = import_module('core.migrations.0005_participation_notify').NOTIFY_MAX_CHANGES
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(limit + 1)])
+        listener = self.listen()
+        WorkingGroupMembership.objects.bulk_create([
+            WorkingGroupMembership(user=user, working_group=self.working_group, participation_level='subscriber')
+            for user in users
+        ])
+        self.assertEqual(self.notifications(listener, 1), [{'project': self.project.pk, 'reload': True}])
+
+    def listening(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT EXISTS (SELECT 1 FROM pg_stat_activity WHERE query = %s AND pid <> pg_backend_pid())',
+                [f'LISTEN {events.CHANNEL}'],
+            )
+            return cursor.fetchone()[0]
+
+    async def stream(self):
+        """Follow the project's events, toggle once they are listened to, then disconnect"""
+        sent, disconnected = [], asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        async def django(scope, receive, send):
+            self.fail('The events request was passed to Django')
+
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        scope = {
+            'type': 'http', 'method': 'GET', 'scheme': 'https', 'root_path': '', 'query_string': b'',
+            'path': f'/projects/{self.project.pk}/events/', 'server': ('testserver', 443),
+            'headers': [(b'host', b'testserver'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode())],
+        }
+        application = asyncio.ensure_future(events.EventsApplication(django)(scope, receive, send))
+        for _ in range(100):
+            if await sync_to_async(self.listening)():
+                break
+            await asyncio.sleep(0.05)
+        await sync_to_async(upsert_participation)(self.user, WORKING_GROUP, self.working_group.id, 'subscriber')
+        for _ in range(100):
+            if len(sent) > 2:
+                break
+            await asyncio.sleep(0.05)
+        disconnected.set()
+        await asyncio.wait_for(application, 5)
+        events.broadcaster.task.cancel()
+        await asyncio.gather(events.broadcaster.task, return_exceptions=True)
+        return sent
+
+    def test_stream(self):
+        with mock.patch.object(events, 'broadcaster', events.Broadcaster()):
+            sent = async_to_sync(self.stream)()
+            self.assertEqual(dict(events.broadcaster.subscribers), {})
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertEqual(sent[1]['body'], b'retry: %d\n\n' % events.RETRY_MS)
+        event, data = sent[2]['body'].decode().rstrip('\n').split('\n')
+        self.assertEqual(event, 'event: participation')
+        self.assertEqual(json.loads(data.removeprefix('data: ')), {'changes': [{
+            'type': 'working_group', 'id': self.working_group.id, 'user': 'alice', 'old': None, 'level': 'subscriber',
+        }]})
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=True)
+class EventsApplicationTests(SimpleTestCase):
+    """The events URL is only served outside Django when Django's checks would pass"""
+
+    def scope(self, scheme='https', host=b'testserver', headers=()):
+        return {
+            'type': 'http', 'method': 'GET', 'scheme': scheme, 'root_path': '', 'query_string': b'',
+            'path': '/projects/1/events/', 'server': ('testserver', 443),
+            'headers': [(b'host', host), *headers],
+        }
+
+    def test_allowed(self):
+        self.assertTrue(events.EventsApplication.allowed(self.scope()))
+        # Behind the proxy of SECURE_PROXY_SSL_HEADER
+        self.assertTrue(events.EventsApplication.allowed(
+            self.scope(scheme='http', headers=[(b'x-forwarded-proto', b'https')])
+        ))
+        self.assertFalse(events.EventsApplication.allowed(self.scope(host=b'evil.example')))
+        self.assertFalse(events.EventsApplication.allowed(self.scope(scheme='http')))
+
+    def test_rejected_requests_go_to_django(self):
+        passed = []
+
+        async def django(scope, receive, send):
+            passed.append(scope)
+
+        for scope in (self.scope(host=b'evil.example'), self.scope(scheme='http')):
+            async_to_sync(events.EventsApplication(django))(scope, None, None)
+        self.assertEqual(len(passed), 2)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    html = '<tr><td>alice</td><td>Subscriber</td></tr>\n' * 20
+
+    def respond(self, response, accept='gzip, deflate, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_gzip_and_brotli(self):
+        for accept, encoding, decompress in [
+            ('gzip, deflate, br', 'br', brotli.decompress),
+            ('gzip, deflate', 'gzip', gzip.decompress),
+        ]:
+            with self.subTest(accept=accept):
+                response = self.respond(HttpResponse(self.html), accept)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+                self.assertEqual(int(response['Content-Length']), len(response.content))
+                self.assertEqual(decompress(response.content).decode(), self.html)
+
+    def test_left_alone(self):
+        for response, accept in [
+            (HttpResponse(self.html[:150]), 'gzip'),  # Below COMPRESSION_MIN_SIZE
+            (HttpResponse(self.html, content_type='image/svg+xml'), 'gzip'),
+            (HttpResponse(self.html), 'identity'),
+            (HttpResponse(os.urandom(600)), 'gzip'),  # Would only grow
+        ]:
+            with self.subTest(content_type=response['Content-Type'], size=len(response.content), accept=accept):
+                content = response.content
+                response = self.respond(response, accept)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(response.content, content)
+        # Vary is only set once the size and type allow compression
+        self.assertNotIn('Vary', self.respond(HttpResponse('short'), 'gzip'))
+        self.assertEqual(self.respond(HttpResponse(self.html), 'identity')['Vary'], 'Accept-Encoding')
+
+    def test_event_stream_is_not_compressed(self):
+        response = self.respond(StreamingHttpResponse(iter([b'data: 1\n\n']), content_type='text/event-stream'))
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_streaming_chunks_are_flushed(self):
+        chunks = [f'<tr><td>row {i}</td></tr>\n'.encode() * 5 for i in range(3)]
+        for make_stream in (iter, self.async_stream):
+            with self.subTest(stream=make_stream.__name__):
+                response = self.respond(StreamingHttpResponse(make_stream(chunks)), 'gzip')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertNotIn('Content-Length', response)
+                parts = self.read(response)
+                # Each compressed part decodes to its whole chunk, without waiting for the next one
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.assertEqual([decompressor.decompress(part) for part in parts[:-1]], chunks)
+                self.assertEqual(decompressor.decompress(parts[-1]) + decompressor.flush(), b'')
+
+    @staticmethod
+    async def async_stream(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    @staticmethod
+    def read(response):
+        if not response.is_async:
+            return list(response.streaming_content)
+
+        async def read():
+            return [part async for part in response.streaming_content]
+        return async_to_sync(read)()
+
+    def test_etag_is_weakened(self):
+        for etag, expected in [('"abc"', 'W/"abc"'), ('W/"abc"', 'W/"abc"')]:
+            with self.subTest(etag=etag):
+                response = HttpResponse(self.html)
+                response['ETag'] = etag
+                self.assertEqual(self.respond(response)['ETag'], expected)
+        response = HttpResponse(self.html)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.respond(response, 'identity')['ETag'], '"abc"')
+
+
+class SkipUnchangedSessionTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_unchanged_sessions_are_not_saved(self):
+        for (backend, store_class), load_async, save_async in product(SESSION_STORES.items(), (False, True), (False, True)):
+            with self.subTest(backend=backend, load_async=load_async, save_async=save_async):
+                created = store_class()
+                created['user'] = '1'
+                created.save()
+
+                session = store_class(created.session_key)
+                value = async_to_sync(session.aget)('user') if load_async else session.get('user')
+                self.assertEqual(value, '1')
+                # Assigned again, as login does on every request
+                session['user'] = value
+                save = async_to_sync(session.asave) if save_async else session.save
+
+                # The wrapped engine, e.g. cached_db.SessionStore
+                engine = store_class.__mro__[2]
+                with mock.patch.object(engine, 'save') as engine_save, mock.patch.object(engine, 'asave') as engine_asave:
+                    save()
+                    self.assertFalse(engine_save.called or engine_asave.called)
+                    session['user'] = '2'
+                    save()
+                    self.assertTrue(engine_asave.called if save_async else engine_save.called)
+
+
+class StubProvider(ThreadingHTTPServer):
+    """A local stand-in for Keycloak's JWKS, token and userinfo endpoints"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubProviderHandler)
+        self.kids = ['k1']
+        self.failing = False
+        self.requests = []  # (method, path, client port, headers, body)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def hits(self, path):
+        return sum(1 for _, p, *_ in self.requests if p == path)
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so that connection reuse shows up in the client ports
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request(b'')
+
+    def do_POST(self):
+        self.handle_request(self.rfile.read(int(self.headers['Content-Length'])))
+
+    def handle_request(self, body):
+        server = self.server
+        server.requests.append((self.command, self.path, self.client_address[1], self.headers, body))
+        if server.failing:
+            return self.reply(500, {})
+        if self.path == '/certs':
+            return self.reply(200, {'keys': [{'kid': kid, 'alg': 'RS256', 'kty': 'RSA'} for kid in server.kids]})
+        if self.path == '/token':
+            return self.reply(200, {'access_token': 'access', 'id_token': 'id'})
+        if self.path == '/userinfo':
+            return self.reply(200, {'sub': '1', 'email': 'alice@example.com'})
+        self.reply(404, {})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubProviderMixin:
+
+    def setUp(self):
+        caches['default'].clear()
+        self.provider = StubProvider()
+        threading.Thread(target=self.provider.serve_forever, daemon=True).start()
+        self.addCleanup(self.provider.server_close)
+        self.addCleanup(self.provider.shutdown)
+
+
+@override_settings(OIDC_JWKS_CACHE_TTL=60, OIDC_JWKS_STALE_TTL=600, OIDC_JWKS_MIN_REFRESH_INTERVAL=30)
+class CachedDocumentTests(StubProviderMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.document = self.new_document()
+
+    def new_document(self):
+        # A fresh per-process copy, sharing the Django cache like another worker would
+        return jwks.CachedDocument('test-jwks', lambda: f'{self.provider.url}/certs')
+
+    def kids(self, data):
+        return [key['kid'] for key in data['keys']]
+
+    def age(self, seconds):
+        """Pretend the cached document was fetched that many seconds earlier"""
+        entry = dict(self.document._local, fetched_at=self.document._local['fetched_at'] - seconds)
+        self.document._local = entry
+        caches['default'].set(self.document.key, entry)
+
+    def wait_for_refresh(self):
+        for thread in threading.enumerate():
+            if thread.name == 'test-jwks-refresh':
+                thread.join(5)
+
+    def test_fresh_copy_is_served_without_fetching(self):
+        self.assertEqual(self.kids(self.document.get()), ['k1'])
+        self.assertEqual(self.kids(self.document.get()), ['k1'])
+        self.assertEqual(self.kids(self.new_document().get()), ['k1'])
+        self.assertEqual(self.provider.hits('/certs'), 1)
+
+    def test_unknown_kid_refreshes_once_per_interval(self):
+        with mock.patch.object(jwks, 'jwks', self.document):
+            self.assertEqual(jwks.find_key('k1', 'RS256')['kid'], 'k1')
+            self.provider.kids = ['k2']
+            self.assertEqual(jwks.find_key('k2', 'RS256')['kid'], 'k2')
+            self.assertEqual(self.provider.hits('/certs'), 2)
+            # A token with a bogus kid cannot make every login hit the provider
+            self.assertIsNone(jwks.find_key('k3', 'RS256'))
+            self.assertEqual(self.provider.hits('/certs'), 2)
+            with override_settings(OIDC_JWKS_MIN_REFRESH_INTERVAL=0):
+                self.provider.kids = ['k3']
+                self.assertEqual(jwks.find_key('k3', 'RS256')['kid'], 'k3')
+            self.assertEqual(self.provider.hits('/certs'), 3)
+
+    def test_stale_copy_is_refreshed_in_background(self):
+        self.document.get()
+        self.age(120)
+        self.provider.kids = ['k2']
+        self.assertEqual(self.kids(self.document.get()), ['k1'])
+        self.wait_for_refresh()
+        self.assertEqual(self.provider.hits('/certs'), 2)
+        self.assertEqual(self.kids(self.document.get()), ['k2'])
+        self.assertEqual(self.kids(self.new_document().get()), ['k2'])
+        self.assertEqual(self.provider.hits('/certs'), 2)
+
+    def test_stale_copy_is_served_while_provider_fails(self):
+        self.document.get()
+        self.age(120)
+        self.provider.failing = True
+        with self.assertLogs('core.jwks', 'WARNING'):
+            self.assertEqual(self.kids(self.document.get()), ['k1'])
+            self.wait_for_refresh()
+        self.assertEqual(self.provider.hits('/certs'), 2)
+        # Still served, and the next request tries again
+        with self.assertLogs('core.jwks', 'WARNING'):
+            self.assertEqual(self.kids(self.document.get()), ['k1'])
+            self.wait_for_refresh()
+        self.assertEqual(self.provider.hits('/certs'), 3)
+        # Past the stale window the failure surfaces
+        self.age(600)
+        with self.assertRaises(HTTPError):
+            self.document.get()
+
+
+class KeycloakBackendRequestTests(StubProviderMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(
+            OIDC_OP_TOKEN_ENDPOINT=f'{self.provider.url}/token',
+            OIDC_OP_USER_ENDPOINT=f'{self.provider.url}/userinfo',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.backend = KeycloakOIDCBackend()
+
+    def test_token_and_userinfo_share_a_connection(self):
+        payload = {'client_id': 'faberorg', 'client_secret': 'secret', 'code': 'abc'}
+        self.assertEqual(self.backend.get_token(dict(payload))['access_token'], 'access')
+        self.assertEqual(self.backend.get_userinfo('access', 'id', {})['email'], 'alice@example.com')
+        self.assertEqual(self.backend.get_token(dict(payload))['id_token'], 'id')
+        token, userinfo, _ = self.provider.requests
+        self.assertIn(b'client_secret=secret', token[4])
+        self.assertEqual(userinfo[3]['Authorization'], 'Bearer access')
+        # One pooled keep-alive connection, instead of one per call
+        self.assertEqual(len({port for _, _, port, *_ in self.provider.requests}), 1)
+
+    @override_settings(OIDC_TOKEN_USE_BASIC_AUTH=True)
+    def test_token_with_basic_auth(self):
+        self.backend.get_token({'client_id': 'faberorg', 'client_secret': 'secret', 'code': 'abc'})
+        _, _, _, headers, body = self.provider.requests[0]
+        self.assertTrue(headers['Authorization'].startswith('Basic '))
+        self.assertNotIn(b'client_secret', body)
+
+    def test_errors(self):
+        self.provider.failing = True
+        with self.assertRaisesMessage(HTTPError, 'Get Token Error'):
+            self.backend.get_token({'client_id': 'faberorg', 'code': 'abc'})
+        with self.assertRaises(HTTPError):
+            self.backend.get_userinfo('access', 'id', {})
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from core import views
+from core import api, async_views, views
 
 app_name = 'core'
 
+# Async versions of the read-heavy pages when served over ASGI
+pages = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.index, name='index'),
-    path('projects/', views.project_list, name='project_list'),
-    path('projects/<int:pk>/', views.project_detail, name='project_detail'),
-    path('projects/table/', views.hierarchy_table, name='hierarchy_table'),
+    path('projects/', pages.project_list, name='project_list'),
+    path('projects/<int:pk>/', pages.project_detail, name='project_detail'),
+    path('projects/table/', pages.hierarchy_table, name='hierarchy_table'),
     path('working-groups/<int:pk>/', views.working_group_detail, name='working_group_detail'),
-    path('topics/<int:pk>/', views.topic_detail, name='topic_detail'),
-    path('projects/participation/', views.project_participation_table, name='project_participation_table'),
+    path('topics/<int:pk>/', pages.topic_detail, name='topic_detail'),
+    path('me/participation/', pages.my_participation, name='my_participation'),
+    path('projects/participation/', pages.project_participation_table, name='project_participation_table'),
+    path('projects/<int:pk>/events/', views.participation_events, name='participation_events'),
     path('toggle-participation/', views.toggle_participation, name='toggle_participation'),
-    path('users_matrix/', views.users_participation_matrix, name='users_participation_matrix'),
+    path('bulk-participation/', views.bulk_participation, name='bulk_participation'),
+    path('users_matrix/', pages.users_participation_matrix, name='users_participation_matrix'),
+    path('users_matrix/export/', pages.users_participation_export, name='users_participation_export'),
+    path('api/projects/', api.project_list, name='api_project_list'),
+    path('api/projects/<int:pk>/', api.project_tree, name='api_project_tree'),
+    path('api/projects/<int:pk>/memberships/', api.project_memberships, name='api_project_memberships'),
+    path('api/users/<str:username>/participation/', api.user_participation, name='api_user_participation'),
 ]
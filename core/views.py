@@ -3,19 +3,49 @@ from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
+import hmac
+import json
 from urllib.parse import urlencode
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .models import Project, WorkingGroup, Topic
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
 from django.views.decorators.http import require_POST
-from django.db import transaction
-from .models import WorkingGroupMembership, TopicMembership
+from django.db import IntegrityError
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from . import dashboard, export, fragments, hierarchy, matrix, metrics
+from .participation import (
+    ACTION_LEVELS, LEADER_ERROR, MEMBERSHIP_TABLES,
+    apply_operations, get_participation_index, remove_participation, upsert_participation,
+)
 
 User = get_user_model()
 
+# Upper bound on operations accepted by bulk_participation
+BULK_PARTICIPATION_MAX_OPERATIONS = 500
+
+# Placeholder in the matrix page where the streamed rows are spliced in
+ROWS_MARKER = '<!-- users-participation-matrix-rows -->'
+
+
+def metrics_view(request):
+    """
+    Prometheus metrics, aggregated across gunicorn workers. Outside DEBUG
+    they need METRICS_TOKEN; scrapers inside the cluster use the separate
+    METRICS_PORT listener (gunicorn.conf.py) instead.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            raise Http404
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+    body, content_type = metrics.render_latest()
+    return HttpResponse(body, content_type=content_type)
+
 
 def index(request):
     return render(request, 'core/index.html')
@@ -50,21 +80,32 @@ def logout_view(request):
 
 # ------------
 
+def _project_tree_or_404(project_id):
+    """Return the cached tree of an active project or raise Http404"""
+    try:
+        project_id = int(project_id)
+    except (TypeError, ValueError):
+        raise Http404("Invalid project id")
+    project = hierarchy.get_project_tree(project_id)
+    if project is None or not project['is_active']:
+        raise Http404("No active project matches the given query.")
+    return project
+
+
 @login_required
 def project_list(request):
     """List all active projects"""
-    projects = Project.objects.filter(is_active=True).prefetch_related('working_groups')
+    projects = [p for p in hierarchy.get_project_index() if p['is_active']]
     return render(request, 'core/project_list.html', {'projects': projects})
 
 
 @login_required
 def project_detail(request, pk):
     """Show project details with working groups"""
-    project = get_object_or_404(Project, pk=pk, is_active=True)
-    working_groups = project.working_groups.all().prefetch_related('topics')
+    project = _project_tree_or_404(pk)
     return render(request, 'core/project_detail.html', {
         'project': project,
-        'working_groups': working_groups
+        'working_groups': project['working_groups']
     })
 
 
@@ -73,9 +114,15 @@ def working_group_detail(request, pk):
     """Show working group details with topics"""
     wg = get_object_or_404(WorkingGroup, pk=pk)
     topics = wg.topics.all()
+    if request.GET.get('sort') == 'activity':
+        # Ordered by the membership counters, no memberships are read
+        topics = topics.order_by(
+            (F('leader_count') + F('contributor_count') + F('subscriber_count')).desc(), 'name'
+        )
     return render(request, 'core/working_group_detail.html', {
         'working_group': wg,
-        'topics': topics
+        'topics': topics,
+        'sort': request.GET.get('sort', ''),
     })
 
 
@@ -89,16 +136,12 @@ def topic_detail(request, pk):
 @login_required
 def hierarchy_table(request):
     """Display all projects, working groups, and topics in a table"""
-    # core/views.py
-    from django.shortcuts import render
-    from .models import Project
+    project_ids = [p['id'] for p in hierarchy.get_project_index()]
+    trees = hierarchy.get_project_trees(project_ids)
+    projects = [trees[project_id] for project_id in project_ids if project_id in trees]
 
-    projects = Project.objects.prefetch_related(
-        'working_groups',
-        'working_groups__topics',
-        'working_groups__memberships',
-        'working_groups__topics__memberships'
-    ).order_by('name')
+    # Load the user's memberships once for the participation tags
+    get_participation_index(request)
 
     return render(request, 'core/hierarchy_table.html', {
         'projects': projects
@@ -112,62 +155,42 @@ def project_participation_table(request):
     if not project_id:
         return redirect('core:project_list')
 
-    project = get_object_or_404(Project, pk=project_id, is_active=True)
+    project = _project_tree_or_404(project_id)
 
     # Get current user's Keycloak ID
     user_keycloak_id = request.user.username  # Adjust based on your Keycloak setup
-    user = request.user
-    user_id = user.id
-
-    # Get all working groups for this project with their topics and memberships
-    working_groups = list(project.working_groups.prefetch_related(
-        'topics',
-        'topics__memberships',
-        'memberships'
-    ).all())
-
-    # Annotate each working group and topic with leader and user participation
-    for wg in working_groups:
-        # Get all memberships for this working group
-        wg_memberships_list = list(wg.memberships.all())
-
-        # Get working group leader
-        wg.leader_membership = next(
-            (m for m in wg_memberships_list if m.participation_level == 'leader'),
-            None
-        )
 
-        # Get current user's participation in working group
-        wg.user_membership = next(
-            (m for m in wg_memberships_list if m.user_id == user_id),
-            None
-        )
-
-        topics_list = list(wg.topics.all())
-        for topic in topics_list:
-            # Get all memberships for this topic
-            memberships_list = list(topic.memberships.all())
-
-            # Get topic leader
-            topic.leader_membership = next(
-                (m for m in memberships_list if m.participation_level == 'leader'),
-                None
-            )
-
-            # Get current user's participation
-            topic.user_membership = next(
-                (m for m in memberships_list if m.user_id == user_id),
-                None
-            )
+    # The table is shared by all users and cached per project version; only
+    # the current user's cells are filled in per request
+    table = fragments.participation_table(project)
+    participation = get_participation_index(request)
 
     context = {
         'project': project,
-        'working_groups': working_groups,
+        'table': fragments.overlay_participation(table, participation),
         'user_keycloak_id': user_keycloak_id,
+        'slot_templates': fragments.slot_templates(),
     }
     return render(request, 'core/project_participation_table.html', context)
 
 
+@login_required
+def participation_events(request, pk):
+    """
+    Live participation updates are only served over ASGI, by
+    core.events.EventsApplication. 204 tells the browser not to reconnect.
+    """
+    return HttpResponse(status=204)
+
+
+@login_required
+def my_participation(request):
+    """List the current user's working group and topic memberships across all projects"""
+    return render(request, 'core/my_participation.html', {
+        'projects': dashboard.get_dashboard(request.user.pk),
+    })
+
+
 @require_POST
 @login_required
 def toggle_participation(request):
@@ -177,108 +200,134 @@ def toggle_participation(request):
     entity_id = request.POST.get('entity_id')
     action = request.POST.get('action')  # 'subscribe', 'contribute', or 'unassign'
 
+    if entity_type not in MEMBERSHIP_TABLES:
+        return JsonResponse({'success': False, 'error': 'Invalid entity type'}, status=400)
+    if action not in ACTION_LEVELS:
+        return JsonResponse({'success': False, 'error': 'Invalid action'}, status=400)
+    try:
+        entity_id = int(entity_id)
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid entity id'}, status=400)
+
+    # One statement per toggle, counters included: an upsert (after a per-user
+    # advisory lock) or a conditional delete, both leaving leader rows untouched
+    new_level = ACTION_LEVELS[action]
+    try:
+        if new_level is None:
+            allowed = remove_participation(user, entity_type, entity_id)
+        else:
+            allowed = upsert_participation(user, entity_type, entity_id, new_level)
+    except IntegrityError:
+        return JsonResponse({'success': False, 'error': 'Not found'}, status=404)
+
+    # Check if user is a leader (cannot modify their own leadership)
+    if not allowed:
+        return JsonResponse({'success': False, 'error': LEADER_ERROR}, status=403)
+
+    return JsonResponse({'success': True, 'new_level': new_level})
+
+
+@require_POST
+@login_required
+def bulk_participation(request):
+    """
+    Apply several participation changes in one request and one transaction.
+
+    Expects a JSON body {"operations": [{"entity_type": ..., "entity_id": ...,
+    "action": ...}, ...]} using the same values as toggle_participation, and
+    returns a result per operation.
+    """
     try:
-        with transaction.atomic():
-            if entity_type == 'working_group':
-                membership, created = WorkingGroupMembership.objects.get_or_create(
-                    user=user,
-                    working_group_id=entity_id
-                )
-            elif entity_type == 'topic':
-                membership, created = TopicMembership.objects.get_or_create(
-                    user=user,
-                    topic_id=entity_id
-                )
-            else:
-                return JsonResponse({'success': False, 'error': 'Invalid entity type'}, status=400)
-
-            # Check if user is a leader (cannot modify their own leadership)
-            if membership.participation_level == 'leader':
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Leaders cannot modify their own participation'
-                }, status=403)
-
-            if action == 'unassign':
-                membership.delete()
-                return JsonResponse({'success': True, 'new_level': None})
-            elif action == 'subscribe':
-                membership.participation_level = 'subscriber'
-                membership.save()
-                return JsonResponse({'success': True, 'new_level': 'subscriber'})
-            elif action == 'contribute':
-                membership.participation_level = 'contributor'
-                membership.save()
-                return JsonResponse({'success': True, 'new_level': 'contributor'})
-            else:
-                return JsonResponse({'success': False, 'error': 'Invalid action'}, status=400)
-
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    operations = payload.get('operations') if isinstance(payload, dict) else payload
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return JsonResponse({'success': False, 'error': 'Expected a list of operations'}, status=400)
+    if len(operations) > BULK_PARTICIPATION_MAX_OPERATIONS:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {BULK_PARTICIPATION_MAX_OPERATIONS} operations per request'
+        }, status=400)
+
+    results = apply_operations(request.user, operations)
+    return JsonResponse({
+        'success': all(result['success'] for result in results),
+        'results': results,
+    })
+
 
 @login_required
 def users_participation_matrix(request):
     """
     Build a matrix where columns are working groups and topics (topics appear after their WG)
     and each row is a user with cell values 'S'/'C'/'L' or ''.
+
+    Only users with at least one membership are listed, paginated by username
+    (``?after=<username>``, optionally filtered with ``?q=``), and rows are
+    streamed so memory stays flat regardless of the user table size.
     """
     project_id = request.GET.get('project')
     if not project_id:
         return redirect('core:project_list')
     project = get_object_or_404(Project, pk=project_id, is_active=True)
 
-    # Load all working groups with topics
-    working_groups = list(WorkingGroup.objects.prefetch_related('topics').order_by('name').all())
-
-    # Build ordered columns: first each WG, then its topics
-    columns = []
-    all_topic_ids = []
-    wg_ids = []
-    for wg_index, wg in enumerate(working_groups, 1):
-        columns.append({'type': 'wg', 'id': wg.id, 'name': wg.name, 'wg_index': wg_index})
-        wg_ids.append(wg.id)
-        for topic_index, topic in enumerate(wg.topics.all().order_by('name'), 1):
-            columns.append({
-                'type': 'topic',
-                'id': topic.id,
-                'name': f"{wg.name} / {topic.name}",
-                'wg_index': wg_index,
-                'topic_index': topic_index
-            })
-            all_topic_ids.append(topic.id)
-
-    # Fetch memberships in bulk and build lookup maps
-    wg_memberships = WorkingGroupMembership.objects.filter(working_group_id__in=wg_ids).select_related('user')
-    topic_memberships = TopicMembership.objects.filter(topic_id__in=all_topic_ids).select_related('user')
-
-    wg_map = {(m.user_id, m.working_group_id): m.participation_level for m in wg_memberships}
-    topic_map = {(m.user_id, m.topic_id): m.participation_level for m in topic_memberships}
-
-    # Map participation_level to single-letter
-    level_letter = {
-        'leader': 'L',
-        'contributor': 'C',
-        'subscriber': 'S'
-    }
+    after = request.GET.get('after') or None
+    search = request.GET.get('q') or None
+
+    columns = matrix.build_columns(project)
+    users, next_after = matrix.member_users(project, after=after, search=search)
 
-    # Build rows for each user
-    users = User.objects.order_by('username').all()
-    rows = []
-    for user in users:
-        statuses = []
-        for col in columns:
-            if col['type'] == 'wg':
-                lvl = wg_map.get((user.id, col['id']))
-            else:
-                lvl = topic_map.get((user.id, col['id']))
-            statuses.append(level_letter.get(lvl, ''))
-        rows.append({
-            'user': user,
-            'statuses': statuses
-        })
-
-    return render(request, 'core/users_participation_matrix.html', {
+    page = render_to_string('core/users_participation_matrix.html', {
         'project': project,
         'columns': columns,
-        'rows': rows,
-    })
+        'has_rows': bool(users),
+        'rows_marker': ROWS_MARKER,
+        'after': after,
+        'search': search or '',
+        'next_after': next_after,
+    }, request=request)
+    head, tail = page.split(ROWS_MARKER, 1)
+
+    def stream():
+        yield head
+        if users:
+            cells = matrix.membership_cells(project, [u.id for u in users])
+            row_template = get_template('core/users_participation_matrix_rows.html')
+            rows = matrix.iter_rows(users, columns, cells)
+            for chunk in matrix.iter_chunks(rows):
+                yield row_template.render({'rows': chunk})
+        yield tail
+
+    return StreamingHttpResponse(stream(), content_type='text/html; charset=utf-8')
+
+
+def _export_response(request, project, stream=None):
+    """StreamingHttpResponse with the export requested by ?layout= and ?format="""
+    layout = request.GET.get('layout', 'long')
+    file_format = request.GET.get('format', 'csv')
+    try:
+        parts = export.export(project, layout=layout, file_format=file_format)
+    except export.ExportError as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(
+        stream(parts) if stream else parts, content_type=export.FORMATS[file_format][0]
+    )
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{export.filename(project, layout, file_format)}"'
+    )
+    return response
+
+
+@login_required
+def users_participation_export(request):
+    """
+    Download the users participation matrix of a project as a file, streamed
+    from a server-side cursor: ``?layout=long|wide`` and ``?format=csv|parquet``.
+    """
+    project_id = request.GET.get('project')
+    if not project_id:
+        return redirect('core:project_list')
+    project = get_object_or_404(Project, pk=project_id, is_active=True)
+    return _export_response(request, project)
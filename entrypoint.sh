@@ -10,10 +10,18 @@ echo "PostgreSQL is ready!"
 echo "Running migrations..."
 python manage.py migrate --noinput
 
-#echo "Collecting static files..."
-#python manage.py collectstatic --noinput --clear
+# Only into an empty database: reloading the fixtures would reset the membership
+# counters of their working groups and topics (loaddata saves them whole). On a
+# first load the membership signals count the fixture memberships.
+if python manage.py shell -c "from core.models import Project; raise SystemExit(Project.objects.exists())"; then
+  echo "Loading initial data..."
+  python manage.py loaddata users projects working_groups topics user_memberships
+fi
 
-echo "Loading initial data..."
-python manage.py loaddata users projects working_groups topics user_memberships
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  echo "Resetting Prometheus multiprocess directory..."
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
 
 exec "$@"
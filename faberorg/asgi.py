@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'faberorg.settings')
+# Route the read-heavy pages to core.async_views (see settings.ASYNC_VIEWS)
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Serve the participation events outside Django's request handling (see core/events.py)
+from core.events import EventsApplication  # noqa: E402
+
+application = EventsApplication(django_application)
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,6 +78,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'faberorg.wsgi.application'
+ASGI_APPLICATION = 'faberorg.asgi.application'
+
+# Serve the read-heavy pages with the async views in core/async_views.py.
+# faberorg.asgi turns this on unless ASYNC_VIEWS is set explicitly.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False').lower() in ('true', '1', 't')
 
 
 # Database
@@ -88,6 +99,116 @@ DATABASES = {
     }
 }
 
+# Connection pooling with psycopg_pool, one pool per worker process. Size it so
+# that replicas * gunicorn workers * DB_POOL_MAX_SIZE stays below Postgres'
+# max_connections (see README). With DB_POOL=False, persistent connections
+# (DB_CONN_MAX_AGE seconds) are used instead.
+DB_POOL = os.environ.get('DB_POOL', 'True').lower() in ('true', '1', 't')
+
+# Connections are health checked before being handed out in both modes.
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', '300')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Set REDIS_URL to share the cache between workers, otherwise each process
+# keeps its own local-memory cache.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'faberorg',
+        }
+    }
+
+# Sessions (see core/sessions.py): 'cached_db' reads them from the cache and
+# writes through to the database, 'cache' keeps them in the cache only, 'db'
+# in the database only. The cache modes need Redis: local-memory caches are
+# per process and would serve sessions that another worker changed or ended.
+SESSION_ENGINE = 'core.sessions'
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if REDIS_URL else 'db')
+if SESSION_BACKEND not in ('cached_db', 'cache', 'db'):
+    raise ImproperlyConfigured("SESSION_BACKEND must be one of cached_db, cache, db")
+if SESSION_BACKEND != 'db':
+    if not REDIS_URL:
+        raise ImproperlyConfigured(f"SESSION_BACKEND={SESSION_BACKEND} needs REDIS_URL")
+    CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'sessions',
+    }
+    SESSION_CACHE_ALIAS = 'sessions'
+
+# Project -> WorkingGroup -> Topic trees (see core/hierarchy.py)
+HIERARCHY_CACHE_ALIAS = 'default'
+HIERARCHY_CACHE_TIMEOUT = int(os.environ.get('HIERARCHY_CACHE_TIMEOUT', '300'))
+
+
+# Per-request query instrumentation (see core/middleware.py)
+QUERY_INSTRUMENTATION_ENABLED = os.environ.get('QUERY_INSTRUMENTATION_ENABLED', 'True').lower() in ('true', '1', 't')
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', '1.0'))
+QUERY_SERVER_TIMING = os.environ.get('QUERY_SERVER_TIMING', 'True').lower() in ('true', '1', 't')
+QUERY_COUNT_THRESHOLD = int(os.environ.get('QUERY_COUNT_THRESHOLD', '50'))
+QUERY_TIME_THRESHOLD_MS = float(os.environ.get('QUERY_TIME_THRESHOLD_MS', '200'))
+QUERY_DUPLICATE_THRESHOLD = int(os.environ.get('QUERY_DUPLICATE_THRESHOLD', '10'))
+
+
+# Compression of HTML, JSON and CSV responses (see core/middleware.py)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+
+# Prometheus metrics (see core/metrics.py). gunicorn serves them on their own
+# listener at METRICS_PORT (gunicorn.conf.py), reached only inside the cluster
+# and without the ALLOWED_HOSTS check. /metrics on the app port answers only
+# "Authorization: Bearer <METRICS_TOKEN>", or anyone with DEBUG.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -124,6 +245,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic (run when building the image) writes content-hashed copies
+# with gzip and brotli variants next to them; WhiteNoise serves the hashed
+# ones with a one year immutable Cache-Control and picks the variant from
+# Accept-Encoding. DEBUG serves the source files as they are.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+# Cache lifetime of the few unhashed files (seconds)
+WHITENOISE_MAX_AGE = int(os.environ.get('WHITENOISE_MAX_AGE', '3600'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -167,12 +307,25 @@ OIDC_OP_TOKEN_ENDPOINT = f"https://{KEYCLOAK_DOMAIN}/realms/{REALM_NAME}/protoco
 OIDC_OP_USER_ENDPOINT = f"https://{KEYCLOAK_DOMAIN}/realms/{REALM_NAME}/protocol/openid-connect/userinfo"
 OIDC_OP_JWKS_ENDPOINT = f"https://{KEYCLOAK_DOMAIN}/realms/{REALM_NAME}/protocol/openid-connect/certs"
 OIDC_OP_LOGOUT_ENDPOINT = f"https://{KEYCLOAK_DOMAIN}/realms/{REALM_NAME}/protocol/openid-connect/logout"
+# Override to point the key lookup at another server, e.g. a local stub JWKS
+OIDC_OP_JWKS_ENDPOINT = os.environ.get('OIDC_OP_JWKS_ENDPOINT', OIDC_OP_JWKS_ENDPOINT)
+
+# Keycloak HTTP calls: timeout in seconds and connection pool size (see core/jwks.py)
+OIDC_TIMEOUT = float(os.environ.get('OIDC_TIMEOUT', '5'))
+OIDC_HTTP_POOL_SIZE = int(os.environ.get('OIDC_HTTP_POOL_SIZE', '10'))
+# Signing keys cache: fresh for OIDC_JWKS_CACHE_TTL seconds, then served stale for
+# up to OIDC_JWKS_STALE_TTL more seconds while being refreshed in the background
+OIDC_JWKS_CACHE_TTL = int(os.environ.get('OIDC_JWKS_CACHE_TTL', '3600'))
+OIDC_JWKS_STALE_TTL = int(os.environ.get('OIDC_JWKS_STALE_TTL', '86400'))
+OIDC_JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('OIDC_JWKS_MIN_REFRESH_INTERVAL', '30'))
 
 # In your production settings (e.g., settings.py or production.py)
 SECURE_SSL_REDIRECT = True
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+# Prometheus scrapes the pods over plain HTTP
+SECURE_REDIRECT_EXEMPT = [r'^metrics$']
 
 # OIDC settings - ensure callback uses HTTPS
 OIDC_RP_CALLBACK_SCHEME = 'https'
@@ -23,5 +23,6 @@ urlpatterns = [
     path('oidc/', include('mozilla_django_oidc.urls')),
     path('logout/', views.logout_view, name='logout'),
     path('authenticated/', views.authenticated_view, name='authenticated'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('', include('core.urls')),
 ]
@@ -0,0 +1,21 @@
+# gunicorn.conf.py - picked up automatically by gunicorn from the working directory
+import os
+
+
+def when_ready(server):
+    """Serve the workers' aggregated metrics from the master on METRICS_PORT"""
+    port = os.environ.get('METRICS_PORT')
+    if port and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # No Host check and no auth: the port is not behind the Service or the ingress
+        start_http_server(int(port), registry=registry)
+        server.log.info("Serving metrics on port %s", port)
+
+
+def child_exit(server, worker):
+    """Drop the metric files of a dead worker so /metrics keeps aggregating live ones"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)